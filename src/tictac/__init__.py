@@ -1,4 +1,6 @@
 from .image import series_roi_means
-from .core import save_table
+from .core import save_table, save_table_db, save_tables_db
+from .core import load_table_db, load_roi_db
 
-__all__ = ['series_roi_means', 'save_table']
+__all__ = ['series_roi_means', 'save_table', 'save_table_db',
+           'save_tables_db', 'load_table_db', 'load_roi_db']
@@ -2,15 +2,51 @@ import SimpleITK as sitk
 from datetime import datetime
 import numpy.typing as npt
 import numpy as np
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
 
 # From core.py
 
 def get_acq_datetime(dicom_path: str) -> datetime: ...
 
+def get_frame_duration(dicom_path: str) -> Optional[float]: ...
+
+def get_frame_timing(dicom_path: str) -> tuple[datetime, Optional[float]]: ...
+
 def save_table(table: dict[str, npt.NDArray[np.float64]], path: str): ...
 
+UNITS: dict[str, float]
+
+def unit_factor(unit_in: str, unit_out: str) -> float: ...
+
+def decay_factors(tacq: npt.NDArray[np.float64],
+                  tdur: npt.NDArray[np.float64],
+                  half_life: float) -> npt.NDArray[np.float64]: ...
+
+def correct_table(table: dict[str, npt.NDArray[np.float64]],
+                  half_life: Optional[float] = ...,
+                  factor: float = ...,
+                  tdur: Optional[npt.NDArray[np.float64]] = ...) \
+        -> dict[str, npt.NDArray[np.float64]]: ...
+
+def save_tables_db(tables: dict[str, dict[str, npt.NDArray[np.float64]]],
+                   path: str,
+                   series: str = ...): ...
+
+def save_table_db(table: dict[str, npt.NDArray[np.float64]],
+                  path: str,
+                  study: str,
+                  series: str = ...): ...
+
+def load_table_db(path: str,
+                  study: str,
+                  series: str = ...) -> dict[str, npt.NDArray[np.float64]]: ...
+
+def load_roi_db(path: str,
+                roi: str,
+                series: Optional[str] = ...) \
+        -> dict[str, dict[str, npt.NDArray[np.float64]]]: ...
+
 
 # From image.py
 
@@ -20,7 +56,116 @@ def load_dynamic_series(dicom_path: str) \
 def resample_series_to_reference(series: list[sitk.Image],
                                  ref: sitk.Image) -> list[sitk.Image]: ...
 
+def series_frame_times(dcm_names: list[str]) \
+        -> dict[str, npt.NDArray[np.float64]]: ...
+
+def select_frames(tacq: npt.NDArray[np.float64],
+                  frames: Optional[tuple[int, int]] = ...,
+                  time_window: Optional[tuple[float, float]] = ...) \
+        -> npt.NDArray[np.int_]: ...
+
+def rebin_frames(tacq: npt.NDArray[np.float64],
+                 tdur: npt.NDArray[np.float64],
+                 sums: dict[str, npt.NDArray[np.float64]],
+                 counts: dict[str, npt.NDArray[np.float64]],
+                 rebin: int) -> dict[str, npt.NDArray[np.float64]]: ...
+
+def parse_derived_roi(expr: str) -> list[tuple[float, str]]: ...
+
+def derive_rois(sums: dict[str, npt.NDArray[np.float64]],
+                counts: dict[str, npt.NDArray[np.float64]],
+                derived: dict[str, list[tuple[float, str]]]) \
+        -> tuple[dict[str, npt.NDArray[np.float64]],
+                 dict[str, npt.NDArray[np.float64]]]: ...
+
+def select_series_backend(dcm_name: str, roi_list: list[list[str]]) -> str: ...
+
 def series_roi_means(series_path: str,
                      roi_list: list[list[str]],
-                     progress: bool = ...)\
-        -> dict[str, npt.NDArray[np.float64]]: ...
\ No newline at end of file
+                     progress: bool = ...,
+                     frames: Optional[tuple[int, int]] = ...,
+                     time_window: Optional[tuple[float, float]] = ...,
+                     rebin: int = ...,
+                     derived: Optional[list[list[str]]] = ...,
+                     backend: str = ...,
+                     dcm_names: Optional[list[str]] = ...,
+                     frame_times: Optional[
+                         dict[str, npt.NDArray[np.float64]]] = ...,
+                     half_life: Optional[float] = ...)\
+        -> dict[str, npt.NDArray[np.float64]]: ...
+
+
+# From backends.py
+
+Backend = Callable[[sitk.Image, sitk.Image, list[int]],
+                   tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]]
+
+BACKENDS: dict[str, Backend]
+
+def label_sums_sitk(img: sitk.Image,
+                    roi: sitk.Image,
+                    labels: list[int]) \
+        -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]: ...
+
+def label_sums_numpy(img: sitk.Image,
+                     roi: sitk.Image,
+                     labels: list[int]) \
+        -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]: ...
+
+def label_sums_numba(img: sitk.Image,
+                     roi: sitk.Image,
+                     labels: list[int]) \
+        -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]: ...
+
+def select_backend(pairs: list[tuple[sitk.Image, sitk.Image, list[int]]],
+                   repeats: int = ...) -> str: ...
+
+
+# From distributed.py
+
+def parse_address(address: str) -> tuple[str, int]: ...
+
+def split_tasks(studies: dict[str, str],
+                roi_list: list[list[str]],
+                frames_per_task: Optional[int] = ...,
+                frames: Optional[tuple[int, int]] = ...,
+                time_window: Optional[tuple[float, float]] = ...,
+                rebin: int = ...,
+                derived: Optional[list[list[str]]] = ...,
+                backend: str = ...,
+                half_life: Optional[float] = ...) -> list[dict[str, Any]]: ...
+
+def merge_results(parts: list[dict[str, npt.NDArray[np.float64]]]) \
+        -> dict[str, npt.NDArray[np.float64]]: ...
+
+def run_worker(address: tuple[str, int],
+               authkey: bytes,
+               poll_interval: float = ...,
+               threads: Optional[int] = ...) -> int: ...
+
+def run_coordinator(tasks: list[dict[str, Any]],
+                    address: tuple[str, int],
+                    authkey: bytes,
+                    n_local_workers: int = ...,
+                    max_retries: int = ...,
+                    task_timeout: Optional[float] = ...,
+                    progress: bool = ...,
+                    threads: Optional[int] = ...) \
+        -> dict[str, dict[str, npt.NDArray[np.float64]]]: ...
+
+
+# From threads.py
+
+def set_threads(n: int): ...
+
+def get_threads() -> int: ...
+
+def split_threads(n: int, n_workers: int) -> int: ...
+
+def max_workers(n: Optional[int], n_workers: int) -> int: ...
+
+def cpu_time() -> float: ...
+
+def cpu_utilisation(cpu_seconds: float,
+                    wall_seconds: float,
+                    threads: Optional[int] = ...) -> float: ...
\ No newline at end of file
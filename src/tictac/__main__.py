@@ -1,5 +1,10 @@
 import argparse
+import os
 import tictac
+import tictac.backends
+import tictac.core
+import tictac.distributed
+import tictac.threads
 import sys
 import importlib.metadata
 import time
@@ -10,6 +15,7 @@ def main(sys_args: list[str]):
     # Get version number from pyproject.toml
     __version__ = importlib.metadata.version("tictac")
     start_time = time.time_ns()
+    start_cpu = tictac.threads.cpu_time()
 
     print("Starting TICTAC", __version__)
     print()
@@ -30,19 +36,124 @@ def main(sys_args: list[str]):
                              "to resample either the ROI or the image data "
                              "before extraction (possible values are 'img', "
                              "'roi' or 'none'.")
+    parser.add_argument("--derive", nargs=2, action="append",
+                        metavar=("LABEL", "EXPR"),
+                        help="Define a derived ROI named LABEL, computed "
+                             "from other ROIs without extra image passes. "
+                             "EXPR combines ROI labels with ' + ' and ' - ', "
+                             "e.g. 'lobe1 + lobe2 - lesion'")
+    parser.add_argument("--decay", type=float, metavar="HALF_LIFE",
+                        help="Decay correct all ROIs to the first frame "
+                             "using the half-life in seconds")
+    parser.add_argument("--units", nargs=2, metavar=("FROM", "TO"),
+                        help="Convert all ROIs from one activity "
+                             "concentration unit to another (known units: "
+                             + ", ".join(tictac.core.UNITS) + ")")
     parser.add_argument("--scale", action='append', nargs=3,
                         metavar=("label_in", "label_out", "factor"),
                         help="Apply a scale factor to label_in and save it "
                              "as label_out")
+    parser.add_argument("--frames", nargs=2, type=int,
+                        metavar=("FIRST", "LAST"),
+                        help="Only extract frames with index FIRST to LAST "
+                             "(0-based, both inclusive)")
+    parser.add_argument("--time-window", nargs=2, type=float,
+                        metavar=("START", "END"),
+                        help="Only extract frames acquired between START and "
+                             "END seconds after the first frame (both "
+                             "inclusive)")
+    parser.add_argument("--rebin", type=int, default=1, metavar="N",
+                        help="Merge every N consecutive frames into one "
+                             "frame using duration-weighted means")
+    parser.add_argument("--backend", default="sitk",
+                        choices=list(tictac.backends.BACKENDS) + ["auto"],
+                        help="Backend computing the ROI statistics. 'auto' "
+                             "times all backends on the first frame and "
+                             "uses the fastest (default 'sitk')")
+    parser.add_argument("--workers", type=int, default=0, metavar="N",
+                        help="Start N local worker processes and distribute "
+                             "the frames of the series between them")
+    parser.add_argument("--serve", metavar="HOST:PORT",
+                        help="Act as coordinator listening on HOST:PORT for "
+                             "workers started with 'python -m "
+                             "tictac.distributed'")
+    parser.add_argument("--authkey", metavar="KEY",
+                        help="Authentication key shared with the workers "
+                             "(required with --serve)")
+    parser.add_argument("--task-timeout", type=float, metavar="SECONDS",
+                        help="Retry a distributed task if its worker has not "
+                             "returned a result this many seconds after "
+                             "picking it up (default: never, but tasks of "
+                             "local workers that die are always retried)")
+    parser.add_argument("--chunk", type=int, default=10, metavar="N",
+                        help="Number of frames in each distributed task "
+                             "(default 10)")
+    parser.add_argument("--format", choices=["txt", "sqlite"], default="txt",
+                        help="Output format. 'txt' writes a text file, "
+                             "'sqlite' appends the TACs to an SQLite "
+                             "database (default 'txt')")
+    parser.add_argument("--study", metavar="KEY",
+                        help="Study key used in the sqlite output (default "
+                             "IMG_PATH)")
+    parser.add_argument("--series", metavar="KEY", default="",
+                        help="Series key used in the sqlite output "
+                             "(default '')")
+    parser.add_argument("--threads", type=int, metavar="N",
+                        help="Number of threads tictac may use in total, "
+                             "shared between SimpleITK, NumPy and local "
+                             "workers (default: all CPUs)")
     parser.add_argument("--hideprogress", action='store_false',
                         help="Hide progress bar")
     args = parser.parse_args(sys_args)
+    if args.serve and not args.authkey:
+        parser.error("--serve requires --authkey")
 
-    # Run ROI-means code
-    dyn = tictac.series_roi_means(
-        series_path=args.i,
-        roi_list=args.roi,
-        progress=args.hideprogress)
+    if args.threads is not None:
+        tictac.threads.set_threads(args.threads)
+
+    if args.serve or args.workers > 0:
+        # Distribute the frames between workers
+        if args.serve:
+            address = tictac.distributed.parse_address(args.serve)
+            authkey = args.authkey.encode()
+        else:
+            address = ('localhost', 0)
+            authkey = os.urandom(16)
+        tasks = tictac.distributed.split_tasks(
+            studies={args.i: args.i},
+            roi_list=args.roi,
+            frames_per_task=args.chunk,
+            frames=args.frames,
+            time_window=args.time_window,
+            rebin=args.rebin,
+            derived=args.derive,
+            backend=args.backend,
+            half_life=args.decay)
+        dyn = tictac.distributed.run_coordinator(
+            tasks=tasks,
+            address=address,
+            authkey=authkey,
+            n_local_workers=args.workers,
+            task_timeout=args.task_timeout,
+            threads=args.threads,
+            progress=args.hideprogress)[args.i]
+    else:
+        # Run ROI-means code
+        dyn = tictac.series_roi_means(
+            series_path=args.i,
+            roi_list=args.roi,
+            progress=args.hideprogress,
+            frames=args.frames,
+            time_window=args.time_window,
+            rebin=args.rebin,
+            derived=args.derive,
+            backend=args.backend,
+            half_life=args.decay)
+
+    # Apply unit conversion (decay correction is applied per frame above)
+    if args.units:
+        dyn = tictac.core.correct_table(
+            dyn, factor=tictac.core.unit_factor(args.units[0], args.units[1]))
 
     # Apply scales if required
     if args.scale:
@@ -51,11 +162,20 @@ def main(sys_args: list[str]):
             scaled_arr = factor * dyn[scale[0]]
             dyn[scale[1]] = scaled_arr
 
-    tictac.save_table(table=dyn, path=args.o)
+    if args.format == "sqlite":
+        tictac.save_table_db(table=dyn, path=args.o,
+                             study=args.study or args.i,
+                             series=args.series)
+    else:
+        tictac.save_table(table=dyn, path=args.o)
 
     # Report successful end of program
     run_time = (time.time_ns() - start_time) * 1e-9
+    utilisation = tictac.threads.cpu_utilisation(
+        tictac.threads.cpu_time() - start_cpu, run_time, args.threads)
     print(f'TICTAC finished successfully in {run_time:.1f} seconds.')
+    print(f'CPU utilisation: {100 * utilisation:.0f}% of '
+          f'{args.threads or os.cpu_count()} threads.')
     print()
 
 
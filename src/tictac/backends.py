@@ -0,0 +1,157 @@
+import SimpleITK as sitk
+import importlib.util
+import time
+
+import numpy as np
+import numpy.typing as npt
+from typing import Any, Callable, Optional
+
+
+# Numba is slow to import, so it is only imported when the numba backend is
+# first used
+_HAS_NUMBA = importlib.util.find_spec('numba') is not None
+_numba_kernel: Optional[Callable[..., Any]] = None
+
+
+# A backend computes the sum of voxel values and the number of voxels for
+# a list of labels in a ROI image. The image and the ROI image must be in the
+# same physical space.
+Backend = Callable[[sitk.Image, sitk.Image, list[int]],
+                   tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]]
+
+
+def label_sums_sitk(img: sitk.Image,
+                    roi: sitk.Image,
+                    labels: list[int]) \
+        -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Compute the sum of voxel values and the number of voxels for a list
+    of labels in a ROI image using SimpleITK's LabelStatisticsImageFilter.
+
+    Arguments:
+    img     --  The image.
+    roi     --  The ROI image, in the same physical space as the image.
+    labels  --  The labels (voxel values) of the ROIs in the ROI image.
+
+    Return value:
+    A tuple with an array of sums and an array of voxel counts in the order
+    of the labels. Labels not present in the ROI image have sum and count 0.
+    """
+
+    label_stats_filter = sitk.LabelStatisticsImageFilter()
+    label_stats_filter.Execute(img, roi)
+
+    sums = np.zeros(len(labels))
+    counts = np.zeros(len(labels))
+    for i, label in enumerate(labels):
+        if label_stats_filter.HasLabel(label):
+            sums[i] = label_stats_filter.GetSum(label)
+            counts[i] = label_stats_filter.GetCount(label)
+    return sums, counts
+
+
+def label_sums_numpy(img: sitk.Image,
+                     roi: sitk.Image,
+                     labels: list[int]) \
+        -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Compute the sum of voxel values and the number of voxels for a list
+    of labels in a ROI image using NumPy. All labels are found in a single
+    pass using numpy.bincount. See label_sums_sitk.
+    """
+
+    values = sitk.GetArrayViewFromImage(img).ravel().astype(np.float64)
+    lab = sitk.GetArrayViewFromImage(roi).ravel().astype(np.int64)
+
+    # Shift the labels to start at bin 0, so negative labels get their own
+    # bins, and put voxels with labels outside the range of interest in an
+    # extra bin
+    low = min(labels)
+    n = max(labels) - low + 1
+    lab = lab - low
+    lab = np.where((lab >= 0) & (lab < n), lab, n)
+
+    all_sums = np.bincount(lab, weights=values,
+                           minlength=n + 1).astype(np.float64)
+    all_counts = np.bincount(lab, minlength=n + 1).astype(np.float64)
+    bins = np.array(labels) - low
+    return all_sums[bins], all_counts[bins]
+
+
+def _label_sums_kernel(values, lab, low, n):  # pragma: no cover
+    # Compiled by Numba, see _get_numba_kernel. The labels are shifted by
+    # low to start at bin 0.
+    sums = np.zeros(n)
+    counts = np.zeros(n)
+    for i in range(values.size):
+        label = np.int64(lab[i]) - low
+        if 0 <= label < n:
+            sums[label] += values[i]
+            counts[label] += 1.0
+    return sums, counts
+
+
+def _get_numba_kernel() -> Callable[..., Any]:
+    """Import numba and compile _label_sums_kernel on first use."""
+
+    global _numba_kernel
+    if _numba_kernel is None:
+        import numba
+        _numba_kernel = numba.njit(cache=True)(_label_sums_kernel)
+    return _numba_kernel
+
+
+def label_sums_numba(img: sitk.Image,
+                     roi: sitk.Image,
+                     labels: list[int]) \
+        -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Compute the sum of voxel values and the number of voxels for a list
+    of labels in a ROI image using a Numba JIT-compiled loop. This backend
+    requires the optional dependency numba. See label_sums_sitk.
+    """
+
+    if not _HAS_NUMBA:
+        raise RuntimeError("The numba backend requires numba to be "
+                           "installed.")
+
+    values = sitk.GetArrayViewFromImage(img).ravel()
+    lab = sitk.GetArrayViewFromImage(roi).ravel()
+
+    low = min(labels)
+    sums, counts = _get_numba_kernel()(values, lab, low,
+                                       max(labels) - low + 1)
+    bins = np.array(labels) - low
+    return sums[bins], counts[bins]
+
+
+BACKENDS: dict[str, Backend] = {'sitk': label_sums_sitk,
+                                'numpy': label_sums_numpy}
+if _HAS_NUMBA:
+    BACKENDS['numba'] = label_sums_numba
+
+
+def select_backend(pairs: list[tuple[sitk.Image, sitk.Image, list[int]]],
+                   repeats: int = 3) -> str:
+    """Find the fastest available backend for a set of images and ROIs. Each
+    backend is run once to warm up (e.g. JIT compilation), and then timed
+    over a number of repeats on all the given image and ROI pairs.
+
+    Arguments:
+    pairs   --  A list of (image, ROI image, labels) tuples, typically the
+                first frame of a series and the ROIs to compute.
+    repeats --  The number of timed runs of each backend (default 3).
+
+    Return value:
+    The name of the fastest backend (a key in BACKENDS).
+    """
+
+    timings = {}
+    for name, backend in BACKENDS.items():
+        for img, roi, labels in pairs:
+            backend(img, roi, labels)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for img, roi, labels in pairs:
+                backend(img, roi, labels)
+        timings[name] = time.perf_counter() - start
+
+    return min(timings, key=lambda name: timings[name])
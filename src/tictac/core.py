@@ -1,7 +1,48 @@
 import SimpleITK as sitk
+import pathlib
+import sqlite3
+from collections import defaultdict
 from datetime import datetime
 import numpy as np
 import numpy.typing as npt
+from typing import Optional
+
+
+def _read_header(dicom_path: str) -> sitk.ImageFileReader:
+    """Read only the dicom header of an image, the pixel data is not
+    needed.
+    """
+
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(dicom_path)
+    reader.ReadImageInformation()
+    return reader
+
+
+def _header_acq_datetime(reader: sitk.ImageFileReader) -> datetime:
+    """Get the acquisition datetime from a reader with the header read."""
+
+    # Read the relevant header tags as strings
+    img_time = reader.GetMetaData('0008|0032')
+    img_date = reader.GetMetaData('0008|0022')
+
+    # Format the strings into ISO 8601 format [ YYYY-MM-DD hh:mm:ss.ffffff ]
+    sd = img_date[:4] + "-" + img_date[4:6] + "-" + img_date[6:]
+    sd = sd + " " + img_time[:2] + ":" + img_time[2:4] + ":" + img_time[4:6]
+    sd = sd + "." + img_time[-1].ljust(6, "0")
+    return datetime.fromisoformat(sd)
+
+
+def _header_frame_duration(reader: sitk.ImageFileReader) -> Optional[float]:
+    """Get the frame duration in seconds from a reader with the header read.
+    """
+
+    if not reader.HasMetaDataKey('0018|1242'):
+        return None
+    duration = reader.GetMetaData('0018|1242').strip()
+    if not duration:
+        return None
+    return float(duration) * 1e-3
 
 
 def get_acq_datetime(dicom_path: str) -> datetime:
@@ -17,18 +58,40 @@ def get_acq_datetime(dicom_path: str) -> datetime:
     A datetime object representing the date and time of the acquisition.
     """
 
-    # Read the dicom image into Simple ITK
-    img = sitk.ReadImage(dicom_path)
+    return _header_acq_datetime(_read_header(dicom_path))
 
-    # Read the relevant header tags as strings
-    img_time = img.GetMetaData('0008|0032')
-    img_date = img.GetMetaData('0008|0022')
 
-    # Format the strings into ISO 8601 format [ YYYY-MM-DD hh:mm:ss.ffffff ]
-    sd = img_date[:4] + "-" + img_date[4:6] + "-" + img_date[6:]
-    sd = sd + " " + img_time[:2] + ":" + img_time[2:4] + ":" + img_time[4:6]
-    sd = sd + "." + img_time[-1].ljust(6, "0")
-    return datetime.fromisoformat(sd)
+def get_frame_duration(dicom_path: str) -> Optional[float]:
+    """Get the duration of an image frame from its dicom header.
+    The duration is read from the Actual Frame Duration tag (0018,1242), which
+    stores the duration in milliseconds. Only the header is read, not the
+    pixel data.
+
+    Arguments:
+    dicom_path  --  The path to the dicom file.
+
+    Return value:
+    The frame duration in seconds, or None if the tag is missing or empty.
+    """
+
+    return _header_frame_duration(_read_header(dicom_path))
+
+
+def get_frame_timing(dicom_path: str) -> tuple[datetime, Optional[float]]:
+    """Get both the acquisition datetime and the frame duration of an image
+    from a single read of its dicom header. See get_acq_datetime and
+    get_frame_duration.
+
+    Arguments:
+    dicom_path  --  The path to the dicom file.
+
+    Return value:
+    A tuple with the acquisition datetime and the frame duration in seconds
+    (None if the tag is missing or empty).
+    """
+
+    reader = _read_header(dicom_path)
+    return _header_acq_datetime(reader), _header_frame_duration(reader)
 
 
 def save_table(table: dict[str, npt.NDArray[np.float64]], path: str):
@@ -50,3 +113,297 @@ def save_table(table: dict[str, npt.NDArray[np.float64]], path: str):
     # Put data into columns and save to file
     data = np.column_stack(columns)
     np.savetxt(path, data, header=header)
+
+
+# Activity concentration units relative to Bq/mL
+UNITS = {'Bq/mL': 1.0,
+         'kBq/mL': 1e3,
+         'MBq/mL': 1e6,
+         'Bq/L': 1e-3,
+         'kBq/L': 1.0,
+         'nCi/mL': 37.0,
+         'uCi/mL': 37e3}
+
+
+def unit_factor(unit_in: str, unit_out: str) -> float:
+    """Get the factor that converts an activity concentration from one unit
+    to another. The known units are the keys of tictac.core.UNITS.
+
+    Arguments:
+    unit_in     --  The unit to convert from.
+    unit_out    --  The unit to convert to.
+
+    Return value:
+    The conversion factor.
+    """
+
+    for unit in (unit_in, unit_out):
+        if unit not in UNITS:
+            raise ValueError(f"Unknown unit '{unit}'. Known units are: "
+                             f"{', '.join(UNITS)}.")
+    return UNITS[unit_in] / UNITS[unit_out]
+
+
+def decay_factors(tacq: npt.NDArray[np.float64],
+                  tdur: npt.NDArray[np.float64],
+                  half_life: float) -> npt.NDArray[np.float64]:
+    """Compute the decay correction factors of the frames in a dynamic
+    series. The correction is made to the acquisition time of the first frame
+    in the series ('tacq' = 0). Since a frame measures the mean activity over
+    its duration, each factor is the decay to the start of the frame,
+    exp(l*tacq), times the decay during the frame, l*tdur/(1-exp(-l*tdur)),
+    where l is the decay constant ln(2)/half_life.
+
+    Arguments:
+    tacq        --  The acquisition times of the frames (in seconds).
+    tdur        --  The durations of the frames (in seconds).
+    half_life   --  The half-life of the isotope in seconds.
+
+    Return value:
+    An array with the correction factor of every frame.
+    """
+
+    lam = np.log(2.0) / half_life
+    x = lam * np.asarray(tdur, dtype=np.float64)
+
+    # The decay during a frame tends to 1 for very short frames
+    during = np.ones_like(x)
+    nonzero = x > 0.0
+    during[nonzero] = x[nonzero] / -np.expm1(-x[nonzero])
+
+    res: npt.NDArray[np.float64] = np.exp(lam * tacq) * during
+    return res
+
+
+def correct_table(table: dict[str, npt.NDArray[np.float64]],
+                  half_life: Optional[float] = None,
+                  factor: float = 1.0,
+                  tdur: Optional[npt.NDArray[np.float64]] = None) \
+        -> dict[str, npt.NDArray[np.float64]]:
+    """Apply decay correction and a constant factor (e.g. a unit conversion,
+    see unit_factor) to every ROI column in a table. All columns are
+    corrected together as one array. The decay correction (see
+    decay_factors) needs the duration of every frame in the table. Note that
+    frames merged by rebinning must be decay corrected before they are merged
+    (see series_roi_means), not afterwards.
+
+    Arguments:
+    table       --  The table-data in a dict form with the acquisition times
+                    under the key 'tacq'.
+    half_life   --  The half-life of the isotope in seconds (default None,
+                    meaning no decay correction).
+    factor      --  A factor to multiply every ROI column by (default 1.0).
+    tdur        --  The durations of the frames in seconds, required for
+                    decay correction (default None).
+
+    Return value:
+    A new table with the corrected ROI columns.
+    """
+
+    if half_life is not None and tdur is None:
+        raise ValueError("Decay correction requires the frame durations.")
+
+    labels = [label for label in table if label != 'tacq']
+    if not labels:
+        return dict(table)
+
+    # Per-frame correction factors
+    frame_factor = np.full(len(table['tacq']), factor)
+    if half_life is not None and tdur is not None:
+        frame_factor *= decay_factors(table['tacq'], tdur, half_life)
+
+    data = np.vstack([table[label] for label in labels]) * frame_factor
+
+    res = dict(table)
+    for i, label in enumerate(labels):
+        res[label] = data[i]
+    return res
+
+
+def _connect_db(path: str) -> sqlite3.Connection:
+    """Open a TAC database, creating the table and index if needed.
+    The TACs are stored in long form with one row per study, series, ROI and
+    frame. The primary key starts with the ROI, so the rows of one ROI
+    across all studies are stored together and can be retrieved quickly.
+    """
+
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE IF NOT EXISTS tac ("
+                "roi TEXT NOT NULL, "
+                "study TEXT NOT NULL, "
+                "series TEXT NOT NULL, "
+                "frame INTEGER NOT NULL, "
+                "tacq REAL NOT NULL, "
+                "value REAL NOT NULL, "
+                "PRIMARY KEY (roi, study, series, frame)) WITHOUT ROWID")
+    con.execute("CREATE INDEX IF NOT EXISTS tac_study "
+                "ON tac (study, series)")
+    return con
+
+
+def _open_db_readonly(path: str) -> sqlite3.Connection:
+    """Open an existing TAC database for reading. Unlike _connect_db, this
+    never creates the database, so a wrong path is reported as an error.
+    """
+
+    db_path = pathlib.Path(path)
+    if not db_path.is_file():
+        raise FileNotFoundError(f"No TAC database at '{path}'.")
+    return sqlite3.connect(db_path.resolve().as_uri() + "?mode=ro", uri=True)
+
+
+def save_tables_db(tables: dict[str, dict[str, npt.NDArray[np.float64]]],
+                   path: str,
+                   series: str = ""):
+    """Saves the tables of a number of studies to an SQLite database. Each
+    table must have the acquisition times under the key 'tacq', and every
+    other column is stored as a ROI. All tables are written in a single
+    transaction. Existing data for the same study, series and ROI is
+    replaced.
+
+    Arguments:
+    tables  --  A dict with study keys and the table-data of each study in a
+                dict form.
+    path    --  The filename of the database.
+    series  --  The series key the tables are stored under (default "").
+    """
+
+    rows: list[tuple[str, str, str, int, float, float]] = []
+    for study, table in tables.items():
+        tacq = table['tacq']
+        for label in table:
+            if label == 'tacq':
+                continue
+            if len(table[label]) != len(tacq):
+                raise ValueError(f"The column '{label}' of study '{study}' "
+                                 f"does not have a value for every frame.")
+            rows.extend(zip([label] * len(tacq),
+                            [study] * len(tacq),
+                            [series] * len(tacq),
+                            range(len(tacq)),
+                            tacq.tolist(),
+                            table[label].tolist()))
+
+    con = _connect_db(path)
+    try:
+        with con:
+            # Remove any old frames that would not be overwritten
+            con.executemany("DELETE FROM tac WHERE roi = ? AND study = ? "
+                            "AND series = ?",
+                            [(label, study, series)
+                             for study, table in tables.items()
+                             for label in table if label != 'tacq'])
+            con.executemany("INSERT INTO tac VALUES (?, ?, ?, ?, ?, ?)",
+                            rows)
+    finally:
+        con.close()
+
+
+def save_table_db(table: dict[str, npt.NDArray[np.float64]],
+                  path: str,
+                  study: str,
+                  series: str = ""):
+    """Saves a table represented by a dict object to an SQLite database.
+    See save_tables_db.
+
+    Arguments:
+    table   --  The table-data in a dict form
+    path    --  The filename of the database.
+    study   --  The study key the table is stored under.
+    series  --  The series key the table is stored under (default "").
+    """
+
+    save_tables_db({study: table}, path, series)
+
+
+def load_table_db(path: str,
+                  study: str,
+                  series: str = "") -> dict[str, npt.NDArray[np.float64]]:
+    """Loads the table of one study from an SQLite database.
+
+    Arguments:
+    path    --  The filename of the database.
+    study   --  The study key of the table.
+    series  --  The series key of the table (default "").
+
+    Return value:
+    The table-data in a dict form with the acquisition times under the key
+    'tacq' and a column for every ROI.
+    """
+
+    con = _open_db_readonly(path)
+    try:
+        rows = con.execute("SELECT roi, tacq, value FROM tac "
+                           "WHERE study = ? AND series = ? "
+                           "ORDER BY roi, frame", (study, series)).fetchall()
+    finally:
+        con.close()
+
+    columns: dict[str, list[float]] = defaultdict(list)
+    times: dict[str, list[float]] = defaultdict(list)
+    for roi, tacq, value in rows:
+        columns[roi].append(value)
+        times[roi].append(tacq)
+
+    # All ROIs of a study must share the acquisition times
+    table: dict[str, npt.NDArray[np.float64]] = {}
+    if columns:
+        tacq = next(iter(times.values()))
+        for roi in times:
+            if times[roi] != tacq:
+                raise ValueError(f"The ROIs of study '{study}', series "
+                                 f"'{series}' do not share the same "
+                                 f"frames.")
+        table['tacq'] = np.array(tacq)
+    for roi in columns:
+        table[roi] = np.array(columns[roi])
+    return table
+
+
+def load_roi_db(path: str,
+                roi: str,
+                series: Optional[str] = None) \
+        -> dict[str, dict[str, npt.NDArray[np.float64]]]:
+    """Loads the data of one ROI across all studies in an SQLite database.
+
+    Arguments:
+    path    --  The filename of the database.
+    roi     --  The ROI label.
+    series  --  Only load data from this series key (default None, meaning
+                all series).
+
+    Return value:
+    A dict with study keys and a table-data dict form for each study with
+    the keys 'tacq' and the ROI label. If more than one series is stored for
+    a study, the study key is 'study/series'.
+    """
+
+    con = _open_db_readonly(path)
+    try:
+        query = "SELECT study, series, tacq, value FROM tac WHERE roi = ?"
+        params: tuple[str, ...] = (roi,)
+        if series is not None:
+            query += " AND series = ?"
+            params = (roi, series)
+        rows = con.execute(query + " ORDER BY study, series, frame",
+                           params).fetchall()
+    finally:
+        con.close()
+
+    times: dict[tuple[str, str], list[float]] = defaultdict(list)
+    values: dict[tuple[str, str], list[float]] = defaultdict(list)
+    for study, ser, tacq, value in rows:
+        times[(study, ser)].append(tacq)
+        values[(study, ser)].append(value)
+
+    # Only include the series key when a study has more than one series
+    n_series: dict[str, int] = defaultdict(int)
+    for study, ser in times:
+        n_series[study] += 1
+
+    res: dict[str, dict[str, npt.NDArray[np.float64]]] = {}
+    for study, ser in times:
+        key = study if n_series[study] == 1 else study + "/" + ser
+        res[key] = {'tacq': np.array(times[(study, ser)]),
+                    roi: np.array(values[(study, ser)])}
+    return res
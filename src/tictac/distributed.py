@@ -0,0 +1,469 @@
+import SimpleITK as sitk
+import argparse
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import time
+from collections import defaultdict
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+from tqdm import tqdm
+
+import tictac.image
+import tictac.threads
+import numpy.typing as npt
+from typing import Any, Optional
+
+
+class _TaskQueue(queue.Queue[dict[str, Any]]):
+
+    def take(self, worker_id: str, timeout: float) -> dict[str, Any]:
+        """Get a task and take a lease on it for a worker. This runs in the
+        manager server process, so the lease is recorded even if the worker
+        dies before it receives the task.
+        """
+
+        task = self.get(timeout=timeout)
+        _result_queue.put(('started', task['id'], task['attempt'],
+                           worker_id))
+        return task
+
+
+# The queues live in the coordinator's manager server process. Workers (and
+# the coordinator itself) access them through proxies over TCP.
+_task_queue = _TaskQueue()
+_result_queue: queue.Queue[tuple[str, int, int, Any]] = queue.Queue()
+
+
+def _get_task_queue() -> _TaskQueue:
+    return _task_queue
+
+
+def _get_result_queue() -> queue.Queue[tuple[str, int, int, Any]]:
+    return _result_queue
+
+
+class _QueueManager(BaseManager):
+    pass
+
+
+_QueueManager.register('get_task_queue', callable=_get_task_queue)
+_QueueManager.register('get_result_queue', callable=_get_result_queue)
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """Parse a network address given as a string on the form HOST:PORT.
+
+    Arguments:
+    address --  The address string.
+
+    Return value:
+    A tuple with the host name and the port number.
+    """
+
+    host, sep, port = address.rpartition(':')
+    if not sep:
+        raise ValueError(f"Address must be on the form HOST:PORT, "
+                         f"got '{address}'.")
+    return host, int(port)
+
+
+def split_tasks(studies: dict[str, str],
+                roi_list: list[list[str]],
+                frames_per_task: Optional[int] = None,
+                frames: Optional[tuple[int, int]] = None,
+                time_window: Optional[tuple[float, float]] = None,
+                rebin: int = 1,
+                derived: Optional[list[list[str]]] = None,
+                backend: str = 'sitk',
+                half_life: Optional[float] = None) -> list[dict[str, Any]]:
+    """Split the work of extracting TACs from a number of studies into tasks
+    that can be processed independently by workers.
+    Each study is given by a key (used to identify the study in the results)
+    and the path to its dynamic dicom series. If frames_per_task is None,
+    each study becomes one task. Otherwise, the selected frames of each study
+    are split into contiguous ranges of at most frames_per_task frames, each
+    becoming a task. The ranges are found from the dicom headers only, and
+    each task carries the file names and frame times of its range, so the
+    workers do not read the headers of the series again. When rebinning, the
+    ranges are rounded up to a whole number of rebinned frames so that no
+    merged frame is split between tasks. With the backend 'auto', the
+    backends are timed once on the first frame of the first task (see
+    select_series_backend), and the fastest is given to every task.
+    Each task is a dict object with the keys 'id', 'study', 'part' (the
+    position of the task within the study), 'series_path', 'roi_list',
+    'frames', 'time_window', 'rebin', 'derived', 'backend', 'half_life',
+    'dcm_names' and 'frame_times' (see series_roi_means).
+
+    Arguments:
+    studies         --  A dict with study keys and dicom series paths.
+    roi_list        --  The lists of ROIs to compute (see series_roi_means).
+    frames_per_task --  The maximum number of frames in a task (default None,
+                        meaning one task per study).
+    frames          --  The frame range to include (see series_roi_means).
+    time_window     --  The time window to include (see series_roi_means).
+    rebin           --  The number of frames to merge (see series_roi_means).
+    derived         --  The derived ROIs to compute (see series_roi_means).
+    backend         --  The statistics backend (see series_roi_means).
+    half_life       --  The half-life for decay correction (see
+                        series_roi_means).
+
+    Return value:
+    A list of tasks in the order of the studies and their frames.
+    """
+
+    if frames_per_task is not None and frames_per_task < 1:
+        raise ValueError(f"frames_per_task must be at least 1, got "
+                         f"{frames_per_task}.")
+    if rebin < 1:
+        raise ValueError(f"rebin must be at least 1, got {rebin}.")
+
+    tasks: list[dict[str, Any]] = []
+    for study, series_path in studies.items():
+
+        if frames_per_task is None:
+            tasks.append({'id': len(tasks),
+                          'study': study,
+                          'part': 0,
+                          'series_path': series_path,
+                          'roi_list': roi_list,
+                          'frames': frames,
+                          'time_window': time_window,
+                          'rebin': rebin,
+                          'derived': derived,
+                          'backend': backend,
+                          'half_life': half_life,
+                          'dcm_names': None,
+                          'frame_times': None})
+        else:
+            # Find the selected frames using the dicom headers only
+            reader = sitk.ImageSeriesReader()
+            dcm_names = reader.GetGDCMSeriesFileNames(series_path)
+            timing = tictac.image.series_frame_times(dcm_names)
+            selected = tictac.image.select_frames(
+                timing['tacq'], frames, time_window)
+            if selected.size == 0:
+                raise ValueError(f"No frames in study '{study}' match the "
+                                 f"selection.")
+
+            # Split the selected frames into contiguous ranges, rounding the
+            # range length up to a whole number of rebinned frames
+            step = -(-frames_per_task // rebin) * rebin
+            for part, i in enumerate(range(0, selected.size, step)):
+                first = int(selected[i])
+                last = int(selected[min(i + step, selected.size) - 1])
+                tasks.append({
+                    'id': len(tasks),
+                    'study': study,
+                    'part': part,
+                    'series_path': series_path,
+                    'roi_list': roi_list,
+                    'frames': (first, last),
+                    'time_window': None,
+                    'rebin': rebin,
+                    'derived': derived,
+                    'backend': backend,
+                    'half_life': half_life,
+                    'dcm_names': dcm_names[first:last + 1],
+                    'frame_times': {'tacq': timing['tacq'][first:last + 1],
+                                    'tdur': timing['tdur'][first:last + 1]}})
+
+    # Time the backends once here, instead of once in every task
+    if backend == 'auto' and tasks:
+        if tasks[0]['dcm_names'] is not None:
+            dcm_name = tasks[0]['dcm_names'][0]
+        else:
+            reader = sitk.ImageSeriesReader()
+            dcm_name = reader.GetGDCMSeriesFileNames(
+                tasks[0]['series_path'])[0]
+        backend = tictac.image.select_series_backend(dcm_name, roi_list)
+        for task in tasks:
+            task['backend'] = backend
+
+    return tasks
+
+
+def merge_results(parts: list[dict[str, npt.NDArray[np.float64]]]) \
+        -> dict[str, npt.NDArray[np.float64]]:
+    """Merge partial results of a study into one result. The partial results
+    must be given in acquisition order, and each is a dict object as returned
+    by series_roi_means.
+
+    Arguments:
+    parts   --  The partial results in acquisition order.
+
+    Return value:
+    A dict object with the columns of the partial results concatenated.
+    """
+
+    return {label: np.concatenate([part[label] for part in parts])
+            for label in parts[0]}
+
+
+def run_worker(address: tuple[str, int],
+               authkey: bytes,
+               poll_interval: float = 1.0,
+               threads: Optional[int] = None) -> int:
+    """Run a worker that pulls tasks from a coordinator, computes the ROI
+    means of each task using series_roi_means and returns the results to the
+    coordinator. The coordinator records a lease on each task as the worker
+    picks it up, so the task can be retried if the worker dies. The worker
+    runs until the coordinator shuts down. A task that raises an exception is
+    reported back to the coordinator as failed, and the worker continues with
+    the next task.
+
+    Arguments:
+    address         --  The address (host, port) of the coordinator.
+    authkey         --  The authentication key shared with the coordinator.
+    poll_interval   --  The time in seconds to wait for a task before
+                        checking again (default 1.0).
+    threads         --  The number of threads the worker may use (default
+                        None, meaning no limit, see tictac.threads).
+
+    Return value:
+    The number of tasks processed by the worker.
+    """
+
+    if threads is not None:
+        tictac.threads.set_threads(threads)
+
+    manager = _QueueManager(address=address, authkey=authkey)
+    manager.connect()
+    task_queue = manager.get_task_queue()  # type: ignore[attr-defined]
+    result_queue = manager.get_result_queue()  # type: ignore[attr-defined]
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    n_done = 0
+    while True:
+        # Get a task and take a lease on it
+        try:
+            task = task_queue.take(worker_id, poll_interval)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            # The coordinator has shut down
+            return n_done
+
+        result: tuple[str, int, int, Any]
+        try:
+            if task['dcm_names'] is None:
+                res = tictac.image.series_roi_means(
+                    series_path=task['series_path'],
+                    roi_list=task['roi_list'],
+                    progress=False,
+                    frames=task['frames'],
+                    time_window=task['time_window'],
+                    rebin=task['rebin'],
+                    derived=task['derived'],
+                    backend=task['backend'],
+                    half_life=task['half_life'])
+            else:
+                res = tictac.image.series_roi_means(
+                    series_path=task['series_path'],
+                    roi_list=task['roi_list'],
+                    progress=False,
+                    rebin=task['rebin'],
+                    derived=task['derived'],
+                    backend=task['backend'],
+                    dcm_names=task['dcm_names'],
+                    frame_times=task['frame_times'],
+                    half_life=task['half_life'])
+            result = ('ok', task['id'], task['attempt'], dict(res))
+        except Exception as e:
+            result = ('error', task['id'], task['attempt'], repr(e))
+
+        try:
+            result_queue.put(result)
+        except (EOFError, OSError):
+            return n_done
+        n_done += 1
+
+
+def run_coordinator(tasks: list[dict[str, Any]],
+                    address: tuple[str, int],
+                    authkey: bytes,
+                    n_local_workers: int = 0,
+                    max_retries: int = 2,
+                    task_timeout: Optional[float] = None,
+                    progress: bool = True,
+                    threads: Optional[int] = None) \
+        -> dict[str, dict[str, npt.NDArray[np.float64]]]:
+    """Run a coordinator that hands out tasks (see split_tasks) to workers
+    and collects their results. Workers can run on other nodes (see
+    run_worker) and connect to the coordinator over TCP. Additionally, a
+    number of local worker processes can be started by the coordinator.
+    A task that fails is put back in the queue, until it has been attempted
+    max_retries + 1 times, after which a RuntimeError is raised. A task is
+    also put back in the queue if the local worker holding it dies (the
+    worker is then replaced), or, if a task_timeout is given, if it has not
+    returned within that many seconds after a worker picked it up. Workers
+    on other nodes that die are only detected by the timeout.
+    The partial results of each study are merged in acquisition order.
+
+    Arguments:
+    tasks           --  The tasks to process.
+    address         --  The address (host, port) to listen on. Use port 0 to
+                        pick any free port.
+    authkey         --  The authentication key shared with the workers.
+    n_local_workers --  The number of local worker processes to start
+                        (default 0). If a thread budget is given, at most
+                        that many local workers are started.
+    max_retries     --  The number of times a failed task is retried
+                        (default 2).
+    task_timeout    --  The time in seconds after a task is picked up by a
+                        worker before it is retried if no result has been
+                        returned (default None, meaning never).
+    progress        --  Show a progress bar (default True).
+    threads         --  The number of threads shared by the local workers
+                        (default None, meaning no limit).
+
+    Return value:
+    A dict object with study keys and the merged result of each study (see
+    series_roi_means) as values.
+    """
+
+    manager = _QueueManager(address=address, authkey=authkey)
+    manager.start()
+    workers = []
+    try:
+        task_queue = manager.get_task_queue()  # type: ignore[attr-defined]
+        result_queue = \
+            manager.get_result_queue()  # type: ignore[attr-defined]
+
+        # Keep the local workers within the thread budget
+        n_local_workers = tictac.threads.max_workers(threads,
+                                                     n_local_workers)
+        worker_threads = None
+        if threads is not None:
+            worker_threads = tictac.threads.split_threads(
+                threads, n_local_workers)
+
+        def start_worker() -> multiprocessing.Process:
+            worker = multiprocessing.Process(
+                target=run_worker,
+                args=(manager.address, authkey, 1.0, worker_threads))
+            worker.start()
+            return worker
+
+        for _ in range(n_local_workers):
+            workers.append(start_worker())
+        restarts = 0
+
+        pending = {task['id']: task for task in tasks}
+        attempts: dict[int, int] = defaultdict(int)
+
+        # Leases of the tasks picked up by workers: (worker id, pick-up time)
+        leases: dict[int, tuple[str, float]] = {}
+
+        # Exit codes of the local workers that have died, by worker id. A
+        # lease of a dead worker may still be waiting in the result queue.
+        dead: dict[str, Optional[int]] = {}
+
+        def submit(task: dict[str, Any], reason: str = ""):
+            if attempts[task['id']] > max_retries:
+                raise RuntimeError(
+                    f"Task {task['id']} (study '{task['study']}', frames "
+                    f"{task['frames']}) failed after {attempts[task['id']]} "
+                    f"attempts: {reason}")
+            attempts[task['id']] += 1
+            leases.pop(task['id'], None)
+            task_queue.put(dict(task, attempt=attempts[task['id']]))
+
+        for task in tasks:
+            submit(task)
+
+        # Partial results of each study, keyed by their part number
+        parts: dict[str, dict[int, dict[str, npt.NDArray[np.float64]]]] = \
+            defaultdict(dict)
+
+        with tqdm(total=len(tasks), disable=(not progress)) as pbar:
+            while pending:
+                try:
+                    status, task_id, attempt, payload = \
+                        result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    status = 'none'
+
+                # Ignore messages about finished tasks and earlier attempts,
+                # except results, which are valid from any attempt
+                if status != 'none' and task_id in pending and \
+                        (attempt == attempts[task_id] or status == 'ok'):
+                    if status == 'started' and payload in dead:
+                        submit(pending[task_id],
+                               f"worker exited with code {dead[payload]}")
+                    elif status == 'started':
+                        leases[task_id] = (payload, time.monotonic())
+                    elif status == 'ok':
+                        task = pending.pop(task_id)
+                        leases.pop(task_id, None)
+                        parts[task['study']][task['part']] = payload
+                        pbar.update()
+                    else:
+                        submit(pending[task_id], payload)
+
+                # Retry the tasks of local workers that have died
+                for k, worker in enumerate(workers):
+                    if worker.is_alive():
+                        continue
+                    worker_id = f"{socket.gethostname()}:{worker.pid}"
+                    dead[worker_id] = worker.exitcode
+                    for task_id, lease in list(leases.items()):
+                        if lease[0] == worker_id:
+                            submit(pending[task_id],
+                                   f"worker exited with code "
+                                   f"{worker.exitcode}")
+                    restarts += 1
+                    if restarts > n_local_workers * (max_retries + 1):
+                        raise RuntimeError("Local workers keep exiting "
+                                           "unexpectedly.")
+                    workers[k] = start_worker()
+
+                # Retry tasks that have been out for too long
+                if task_timeout is not None:
+                    now = time.monotonic()
+                    for task_id, lease in list(leases.items()):
+                        if now - lease[1] > task_timeout:
+                            submit(pending[task_id], "timed out")
+
+    finally:
+        manager.shutdown()
+        for worker in workers:
+            worker.join()
+
+    return {study: merge_results([parts[study][p]
+                                  for p in sorted(parts[study])])
+            for study in parts}
+
+
+def main(sys_args: list[str]):
+
+    parser = argparse.ArgumentParser(prog="python -m tictac.distributed")
+    parser.add_argument("--connect", metavar="HOST:PORT",
+                        help="Address of the coordinator",
+                        required=True)
+    parser.add_argument("--authkey", metavar="KEY",
+                        help="Authentication key shared with the coordinator",
+                        required=True)
+    parser.add_argument("--threads", type=int, metavar="N",
+                        help="Number of threads the worker may use")
+    args = parser.parse_args(sys_args)
+
+    start_time = time.time()
+    start_cpu = tictac.threads.cpu_time()
+
+    print(f"Connecting to TICTAC coordinator at {args.connect}")
+    n_done = run_worker(parse_address(args.connect), args.authkey.encode(),
+                        threads=args.threads)
+
+    run_time = time.time() - start_time
+    utilisation = tictac.threads.cpu_utilisation(
+        tictac.threads.cpu_time() - start_cpu, run_time, args.threads)
+    print(f"TICTAC worker finished after {n_done} tasks "
+          f"(CPU utilisation {100 * utilisation:.0f}%).")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -4,6 +4,7 @@ from collections import defaultdict
 import numpy as np
 from tqdm import tqdm
 
+import tictac.backends
 import tictac.core
 import numpy.typing as npt
 from typing import Any, Optional
@@ -70,9 +71,269 @@ def resample_series_to_reference(series: list[sitk.Image],
     return [resampler.Execute(img) for img in series]
 
 
+def series_frame_times(dcm_names: list[str]) \
+        -> dict[str, npt.NDArray[np.float64]]:
+    """Read the timing information of a dynamic image series from the dicom
+    headers only. No pixel data is loaded, so this is cheap compared to
+    reading the images themselves and can be used to decide which frames
+    are worth reading.
+    The function returns a dictionary object with the keys 'tacq' and 'tdur'.
+    Under the key 'tacq' the acquisition times relative to the first image
+    are stored in seconds. Under the key 'tdur' the frame durations are stored
+    in seconds. If a frame duration is not present in the dicom header, it is
+    estimated as the time until the next frame starts (the last frame gets the
+    same duration as the frame before it). A series with a single frame has
+    no such estimate, so a missing duration is then set to 1 second. The
+    duration of a single frame does not affect its ROI means, only its decay
+    correction (see tictac.core.decay_factors).
+
+    Arguments:
+    dcm_names   --  The dicom file names sorted according to acquisition time.
+
+    Return value:
+    A dict object with keys 'tacq' (acquisition times in seconds) and 'tdur'
+    (frame durations in seconds).
+    """
+
+    # Read each header once for both the acquisition time and duration
+    timing = [tictac.core.get_frame_timing(name) for name in dcm_names]
+    durations = [duration for _, duration in timing]
+
+    # Get acquisition times relative to the first image
+    acq0 = timing[0][0]
+    tacq = np.array([(acq - acq0).total_seconds() for acq, _ in timing])
+
+    # Estimate missing durations from the acquisition times
+    tdiff = np.diff(tacq)
+    if tdiff.size > 0:
+        tdiff = np.append(tdiff, tdiff[-1])
+    else:
+        # A single frame without a duration is assumed to last 1 second
+        tdiff = np.ones(1)
+    tdur = np.array([tdiff[i] if d is None else d
+                     for i, d in enumerate(durations)])
+
+    return {'tacq': tacq,
+            'tdur': tdur}
+
+
+def select_frames(tacq: npt.NDArray[np.float64],
+                  frames: Optional[tuple[int, int]] = None,
+                  time_window: Optional[tuple[float, float]] = None) \
+        -> npt.NDArray[np.int_]:
+    """Find the indices of the frames in a dynamic series that should be
+    included in an analysis. Frames can be selected by index, by acquisition
+    time or both, in which case a frame must satisfy both criteria.
+
+    Arguments:
+    tacq        --  The acquisition times of the frames relative to the first
+                    frame (in seconds).
+    frames      --  The first and last frame index (0-based, both inclusive)
+                    to include. If None, all frames are included.
+    time_window --  The earliest and latest acquisition time (in seconds,
+                    both inclusive) of the frames to include. If None, all
+                    frames are included.
+
+    Return value:
+    An array with the indices of the selected frames in increasing order.
+    """
+
+    keep = np.ones(len(tacq), dtype=bool)
+    idx = np.arange(len(tacq))
+
+    if frames is not None:
+        keep &= (idx >= frames[0]) & (idx <= frames[1])
+
+    if time_window is not None:
+        keep &= (tacq >= time_window[0]) & (tacq <= time_window[1])
+
+    return idx[keep]
+
+
+def rebin_frames(tacq: npt.NDArray[np.float64],
+                 tdur: npt.NDArray[np.float64],
+                 sums: dict[str, npt.NDArray[np.float64]],
+                 counts: dict[str, npt.NDArray[np.float64]],
+                 rebin: int) -> dict[str, npt.NDArray[np.float64]]:
+    """Merge consecutive frames of a dynamic series into coarser frames.
+    Every group of 'rebin' consecutive frames is merged into one frame (the
+    last group may contain fewer frames). The ROI mean of a merged frame is
+    the duration-weighted mean of the frames in the group, computed from the
+    per-frame ROI sums and voxel counts. The acquisition time of a merged
+    frame is the acquisition time of the first frame in the group.
+
+    Arguments:
+    tacq    --  The acquisition times of the frames (in seconds).
+    tdur    --  The durations of the frames (in seconds).
+    sums    --  The per-frame sum of voxel values in each ROI.
+    counts  --  The per-frame number of voxels in each ROI.
+    rebin   --  The number of consecutive frames to merge.
+
+    Return value:
+    A dict object with ROI labels as keys and the merged ROI mean values as
+    values. The merged acquisition times are stored under the key 'tacq'.
+    """
+
+    # Index of the first frame in each group
+    starts = np.arange(0, len(tacq), rebin)
+
+    res: dict[str, npt.NDArray[np.float64]] = {'tacq': tacq[starts]}
+    for label in sums:
+        wsum = np.add.reduceat(sums[label] * tdur, starts)
+        wcount = np.add.reduceat(counts[label] * tdur, starts)
+        res[label] = wsum / wcount
+
+    return res
+
+
+def parse_derived_roi(expr: str) -> list[tuple[float, str]]:
+    """Parse the expression of a derived ROI. The expression is a number of
+    ROI labels separated by '+' or '-' with spaces around them, e.g.
+    "lobe1 + lobe2 - lesion". A '+' adds the voxels of a ROI to the derived
+    ROI and a '-' removes them.
+
+    Arguments:
+    expr    --  The expression.
+
+    Return value:
+    A list of (weight, label) pairs, where weight is 1.0 or -1.0.
+    """
+
+    tokens = expr.split()
+    if not tokens or tokens[0] not in ('+', '-'):
+        tokens = ['+'] + tokens
+    if len(tokens) % 2 != 0:
+        raise ValueError(f"Invalid derived ROI expression '{expr}'.")
+
+    terms = []
+    for op, label in zip(tokens[::2], tokens[1::2]):
+        if op not in ('+', '-') or label in ('+', '-'):
+            raise ValueError(f"Invalid derived ROI expression '{expr}'.")
+        terms.append((1.0 if op == '+' else -1.0, label))
+    return terms
+
+
+def derive_rois(sums: dict[str, npt.NDArray[np.float64]],
+                counts: dict[str, npt.NDArray[np.float64]],
+                derived: dict[str, list[tuple[float, str]]]) \
+        -> tuple[dict[str, npt.NDArray[np.float64]],
+                 dict[str, npt.NDArray[np.float64]]]:
+    """Compute the per-frame voxel sums and counts of derived ROIs from the
+    sums and counts of other ROIs. The result is exact if the added ROIs do
+    not overlap, and the subtracted ROIs lie inside the added ones.
+
+    Arguments:
+    sums    --  The per-frame sum of voxel values in each ROI.
+    counts  --  The per-frame number of voxels in each ROI.
+    derived --  A dict with the labels of the derived ROIs as keys and their
+                parsed expressions (see parse_derived_roi) as values.
+
+    Return value:
+    A tuple with the sums and counts of the ROIs with the derived ROIs added.
+    """
+
+    sums = dict(sums)
+    counts = dict(counts)
+    for label, terms in derived.items():
+        sums[label] = np.sum([w * sums[roi] for w, roi in terms], axis=0)
+        counts[label] = np.sum([w * counts[roi] for w, roi in terms],
+                               axis=0)
+    return sums, counts
+
+
+def _load_rois(roi_list: list[list[str]], reference_path: str) \
+        -> tuple[dict[tuple[str, str], list[list[str]]],
+                 dict[tuple[str, str], sitk.Image]]:
+    """Group the ROIs by file and resampling strategy and read the ROI image
+    of each group. All labels in a group are found in a single statistics
+    pass per frame. ROI images resampled with the strategy 'roi' are
+    resampled to the image at reference_path.
+    """
+
+    groups: dict[tuple[str, str], list[list[str]]] = defaultdict(list)
+    for roi in roi_list:
+        groups[(roi[0], roi[3])].append(roi)
+
+    # Read in all rois
+    rois: dict[tuple[str, str], sitk.Image] = {}
+    for path, resample in groups:
+        roi_image = sitk.ReadImage(path)
+
+        # Resample ROI if chosen
+        if resample == 'roi':
+            resampler = sitk.ResampleImageFilter()
+            resampler.SetReferenceImage(sitk.ReadImage(reference_path))
+            resampler.SetInterpolator(sitk.sitkNearestNeighbor)
+            roi_image = resampler.Execute(roi_image)
+
+        rois[(path, resample)] = roi_image
+
+    return groups, rois
+
+
+def _frame_pairs(img: sitk.Image,
+                 groups: dict[tuple[str, str], list[list[str]]],
+                 rois: dict[tuple[str, str], sitk.Image]) \
+        -> list[tuple[sitk.Image, sitk.Image, list[int]]]:
+    """Pair the ROI image of each group (see _load_rois) with the image to
+    compute its statistics on, and the labels of the group.
+    """
+
+    # Placeholder for resampled img if needed
+    resampled_img: Optional[sitk.Image] = None
+
+    pairs = []
+    for key, group in groups.items():
+        roi_image = rois[key]
+
+        # Resample image if chosen
+        if key[1] == 'img':
+            if (resampled_img is None or
+                    not roi_image.IsSameImageGeometryAs(resampled_img)):
+                # Image needs to be resampled
+                resampler = sitk.ResampleImageFilter()
+                resampler.SetReferenceImage(roi_image)
+                resampler.SetInterpolator(sitk.sitkNearestNeighbor)
+                resampled_img = resampler.Execute(img)
+            pairs.append((resampled_img, roi_image,
+                          [int(roi[1]) for roi in group]))
+        else:
+            pairs.append((img, roi_image, [int(roi[1]) for roi in group]))
+
+    return pairs
+
+
+def select_series_backend(dcm_name: str, roi_list: list[list[str]]) -> str:
+    """Find the fastest backend for computing the statistics of a list of
+    ROIs, by timing every available backend on one frame of a series (see
+    tictac.backends.select_backend). When a series is split into several
+    tasks, the backend should be selected once and given to every task.
+
+    Arguments:
+    dcm_name    --  The dicom file name of the frame to time the backends on.
+    roi_list    --  The lists of ROIs to compute (see series_roi_means).
+
+    Return value:
+    The name of the fastest backend (a key in tictac.backends.BACKENDS).
+    """
+
+    groups, rois = _load_rois(roi_list, dcm_name)
+    return tictac.backends.select_backend(
+        _frame_pairs(sitk.ReadImage(dcm_name), groups, rois))
+
+
 def series_roi_means(series_path: str,
                      roi_list: list[list[str]],
-                     progress: bool = True)\
+                     progress: bool = True,
+                     frames: Optional[tuple[int, int]] = None,
+                     time_window: Optional[tuple[float, float]] = None,
+                     rebin: int = 1,
+                     derived: Optional[list[list[str]]] = None,
+                     backend: str = 'sitk',
+                     dcm_names: Optional[list[str]] = None,
+                     frame_times: Optional[
+                         dict[str, npt.NDArray[np.float64]]] = None,
+                     half_life: Optional[float] = None)\
         -> dict[str, npt.NDArray[np.float64]]:
     """Do a lazy calculation of mean image values in a ROI. Lazy in this
     context means that the images are loaded one at a time and the mean values
@@ -91,6 +352,23 @@ def series_roi_means(series_path: str,
        (the dynamic images should be resampled to the ROI image space), "roi"
        (the ROI image should be resampled to the dynamic image physical space).
     In either case the resampling is done using nearest-neighbour values.
+    ROIs from the same file with the same resampling strategy share a single
+    statistics pass per frame.
+    Derived ROIs are given in a list of [label, expression] pairs, where the
+    expression combines the labels (roi[2]) of other ROIs (see
+    parse_derived_roi). They are computed from the voxel sums and counts of
+    the other ROIs, so they cost no extra statistics passes.
+    The statistics are computed by one of the backends in
+    tictac.backends.BACKENDS. With the backend 'auto', every available
+    backend is timed on the first frame and the fastest is used for the rest
+    of the series (see select_series_backend).
+    A subset of the frames can be selected by index and/or by acquisition
+    time. The selection is made from the dicom headers before any pixel data
+    is read, so frames outside the selection are never loaded. The selected
+    frames can furthermore be merged into coarser frames (see rebin_frames).
+    Decay correction (see tictac.core.decay_factors) is applied to every
+    frame before the frames are merged, since a merged frame has no single
+    decay factor.
     The function returns a dictionary object. The keys in the object are
     'tacq' which stores a list of acquisition times (relative to the first
     image) and the labels of the ROI (integers) (see the keyword argument
@@ -100,6 +378,24 @@ def series_roi_means(series_path: str,
     Arguments:
     series_path --  The path to the images series dicom files
     roi_list    --  The lists of ROIs to compute
+    progress    --  Show a progress bar (default True)
+    frames      --  The first and last frame index (0-based, both inclusive)
+                    to include (default None, meaning all frames)
+    time_window --  The earliest and latest acquisition time in seconds to
+                    include (default None, meaning all frames)
+    rebin       --  The number of consecutive frames to merge into one
+                    (default 1, meaning no merging)
+    derived     --  The derived ROIs to compute (default None)
+    backend     --  The backend computing the ROI statistics, or 'auto'
+                    (default 'sitk')
+    dcm_names   --  The dicom file names of the series sorted according to
+                    acquisition time, if already known (default None, meaning
+                    they are found from series_path)
+    frame_times --  The frame times of dcm_names as returned by
+                    series_frame_times, if already known (default None,
+                    meaning they are read from the dicom headers)
+    half_life   --  The half-life of the isotope in seconds for decay
+                    correction (default None, meaning no decay correction)
 
     Return value:
     A dict object with ROI labels as keys and a list with ROI mean values for
@@ -107,69 +403,84 @@ def series_roi_means(series_path: str,
     acquisition times are stored in a list under the key 'tacq'.
     """
 
-    res: dict[str, npt.NDArray[np.float64]] = defaultdict(
-        lambda: np.ndarray(0))
-
-    # Prepare series reader
-    reader = sitk.ImageSeriesReader()
-
-    # Get dicom file names in folder sorted according to acquisition time.
-    dcm_names = reader.GetGDCMSeriesFileNames(series_path)
-
-    # Read in all rois
-    rois = []
-    for roi in roi_list:
-        roi_image = sitk.ReadImage(roi[0])
-
-        # Resample ROI if chosen
-        if roi[3] == 'roi':
-            resampler = sitk.ResampleImageFilter()
-            resampler.SetReferenceImage(sitk.ReadImage(dcm_names[0]))
-            resampler.SetInterpolator(sitk.sitkNearestNeighbor)
-            roi_image = resampler.Execute(roi_image)
-
-        rois.append(roi_image)
-
-    # Prepare label statistics filter
-    label_stats_filter = sitk.LabelStatisticsImageFilter()
-
-    # Get acquisition time of first image
-    acq0 = tictac.core.get_acq_datetime(dcm_names[0])
-
-    for name in tqdm(dcm_names, disable=(not progress)):
+    if rebin < 1:
+        raise ValueError(f"rebin must be at least 1, got {rebin}.")
+    if backend != 'auto' and backend not in tictac.backends.BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Available backends "
+                         f"are: {', '.join(tictac.backends.BACKENDS)}.")
+
+    if dcm_names is None:
+        # Prepare series reader
+        reader = sitk.ImageSeriesReader()
+
+        # Get dicom file names in folder sorted according to acquisition time.
+        dcm_names = list(reader.GetGDCMSeriesFileNames(series_path))
+
+    # Find the frames to read using the dicom headers only
+    timing = frame_times
+    if timing is None:
+        timing = series_frame_times(dcm_names)
+    selected = select_frames(timing['tacq'], frames, time_window)
+    if selected.size == 0:
+        raise ValueError("No frames in the series match the selection.")
+
+    groups, rois = _load_rois(roi_list, dcm_names[selected[0]])
+
+    # Parse the derived ROIs and check that their components are computed in
+    # the same image space
+    derived_terms: dict[str, list[tuple[float, str]]] = {}
+    roi_keys = {roi[2]: (roi[0], roi[3]) for roi in roi_list}
+    for label, expr in derived or []:
+        terms = parse_derived_roi(expr)
+        keys = []
+        for _, component in terms:
+            if component not in roi_keys:
+                raise ValueError(f"Derived ROI '{label}' uses unknown ROI "
+                                 f"'{component}'.")
+            keys.append(roi_keys[component])
+        if (len({key[1] for key in keys}) > 1 or
+                (keys[0][1] == 'img' and
+                 not all(rois[key].IsSameImageGeometryAs(rois[keys[0]])
+                         for key in keys))):
+            raise ValueError(f"The ROIs of derived ROI '{label}' are not "
+                             f"computed in the same image space.")
+        derived_terms[label] = terms
+
+    # Per-frame ROI sums and voxel counts
+    sums = {roi[2]: np.zeros(selected.size) for roi in roi_list}
+    counts = {roi[2]: np.zeros(selected.size) for roi in roi_list}
+
+    for k, frame in enumerate(tqdm(selected, disable=(not progress))):
         # Load images in order
-        img = sitk.ReadImage(name)
-
-        # Placeholder for resampled img if needed
-        resampled_img: Optional[sitk.Image] = None
-
-        # Find acquisition time and store in list
-        res['tacq'] = np.append(
-            res['tacq'],
-            (tictac.core.get_acq_datetime(name) - acq0).total_seconds())
+        pairs = _frame_pairs(sitk.ReadImage(dcm_names[frame]), groups, rois)
 
-        for i, roi in enumerate(roi_list):
+        # Pick the fastest backend using the first frame
+        if backend == 'auto':
+            backend = tictac.backends.select_backend(pairs)
 
-            # Resample image if chosen
-            if roi[3] == 'img':
-                if (resampled_img is None or
-                        not rois[i].IsSameImageGeometryAs(resampled_img)):
-                    # Image needs to be resampled
-                    resampler = sitk.ResampleImageFilter()
-                    resampler.SetReferenceImage(rois[i])
-                    resampler.SetInterpolator(sitk.sitkNearestNeighbor)
-                    resampled_img = resampler.Execute(img)
+        # Store the sum and count for each label in each group.
+        for (frame_img, roi_image, labels), group in zip(pairs,
+                                                         groups.values()):
+            group_sums, group_counts = tictac.backends.BACKENDS[backend](
+                frame_img, roi_image, labels)
+            for j, roi in enumerate(group):
+                sums[roi[2]][k] = group_sums[j]
+                counts[roi[2]][k] = group_counts[j]
 
-                # Apply label stats filter on resampled img and read ROI means
-                label_stats_filter.Execute(resampled_img, rois[i])
-
-            else:
-
-                # Apply label stats filter on original img and read ROI means
-                label_stats_filter.Execute(img, rois[i])
-
-            # Append the mean value to the list for each label.
-            res[roi[2]] = np.append(res[roi[2]],
-                                    label_stats_filter.GetMean(int(roi[1])))
-
-    return res
+    for roi in roi_list:
+        if not np.any(counts[roi[2]]):
+            raise ValueError(f"The label {roi[1]} of ROI '{roi[2]}' was not "
+                             f"found in {roi[0]}.")
+
+    # Decay correct each frame before merging frames. The correction is
+    # linear, so it can be applied to the sums.
+    if half_life is not None:
+        decay = tictac.core.decay_factors(timing['tacq'][selected],
+                                          timing['tdur'][selected],
+                                          half_life)
+        sums = {label: sums[label] * decay for label in sums}
+
+    sums, counts = derive_rois(sums, counts, derived_terms)
+
+    return rebin_frames(timing['tacq'][selected], timing['tdur'][selected],
+                        sums, counts, rebin)
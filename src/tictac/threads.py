@@ -0,0 +1,132 @@
+import SimpleITK as sitk
+import os
+import sys
+import warnings
+
+from typing import Optional
+
+try:
+    import threadpoolctl
+except ImportError:  # pragma: no cover
+    threadpoolctl = None  # type: ignore[assignment]
+
+
+# Environment variables read by the BLAS and OpenMP libraries used by NumPy
+_THREAD_ENV_VARS = ['OMP_NUM_THREADS',
+                    'OPENBLAS_NUM_THREADS',
+                    'MKL_NUM_THREADS',
+                    'BLIS_NUM_THREADS',
+                    'VECLIB_MAXIMUM_THREADS',
+                    'NUMEXPR_NUM_THREADS',
+                    'NUMBA_NUM_THREADS']
+
+
+def set_threads(n: int):
+    """Set the number of threads tictac may use in this process. This sets
+    the global default number of threads of SimpleITK (used by e.g.
+    ReadImage, ResampleImageFilter and LabelStatisticsImageFilter) and the
+    number of NumPy/BLAS threads. The BLAS thread pools of the running
+    process are only limited if the optional dependency threadpoolctl is
+    installed (a RuntimeWarning is issued otherwise, if NumPy has already
+    loaded them), but the limit is always passed on to new processes
+    through environment variables (which also limit Numba in new
+    processes).
+
+    Arguments:
+    n   --  The number of threads.
+    """
+
+    if n < 1:
+        raise ValueError(f"The number of threads must be at least 1, "
+                         f"got {n}.")
+
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(n)
+
+    for var in _THREAD_ENV_VARS:
+        os.environ[var] = str(n)
+    if threadpoolctl is not None:
+        threadpoolctl.threadpool_limits(limits=n)
+    elif 'numpy' in sys.modules:
+        warnings.warn("threadpoolctl is not installed, so the NumPy/BLAS "
+                      "threads of this process are not limited (only those "
+                      "of new processes). Install it with 'pip install "
+                      "tictac[threads]'.", RuntimeWarning)
+
+
+def get_threads() -> int:
+    """Get the number of threads SimpleITK uses by default in this process.
+
+    Return value:
+    The number of threads.
+    """
+
+    return int(sitk.ProcessObject.GetGlobalDefaultNumberOfThreads())
+
+
+def split_threads(n: int, n_workers: int) -> int:
+    """Split a thread budget between a number of worker processes. The
+    number of workers should not exceed the budget (see max_workers), since
+    every worker uses at least one thread.
+
+    Arguments:
+    n           --  The total number of threads.
+    n_workers   --  The number of worker processes.
+
+    Return value:
+    The number of threads each worker may use (at least 1).
+    """
+
+    return max(1, n // max(1, n_workers))
+
+
+def max_workers(n: Optional[int], n_workers: int) -> int:
+    """Limit a number of worker processes to a thread budget, so that every
+    worker can have at least one thread of the budget.
+
+    Arguments:
+    n           --  The total number of threads (None means no limit).
+    n_workers   --  The requested number of worker processes.
+
+    Return value:
+    The number of worker processes to start.
+    """
+
+    if n is None:
+        return n_workers
+    return min(n_workers, n)
+
+
+def cpu_time() -> float:
+    """Get the CPU time used by this process and its terminated child
+    processes (e.g. local workers that have been joined). Child processes
+    are not included on Windows.
+
+    Return value:
+    The CPU time in seconds.
+    """
+
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def cpu_utilisation(cpu_seconds: float,
+                    wall_seconds: float,
+                    threads: Optional[int] = None) -> float:
+    """Compute the achieved CPU utilisation of a thread budget.
+
+    Arguments:
+    cpu_seconds     --  The CPU time used (see cpu_time).
+    wall_seconds    --  The wall clock time elapsed.
+    threads         --  The thread budget (default None, meaning the number
+                        of CPUs in the machine).
+
+    Return value:
+    The fraction of the thread budget that was used, where 1.0 means that
+    all threads were busy all the time.
+    """
+
+    if threads is None:
+        threads = os.cpu_count() or 1
+    if wall_seconds <= 0.0:
+        return 0.0
+    return cpu_seconds / (wall_seconds * threads)
@@ -0,0 +1,118 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import unittest
+import numpy as np
+import SimpleITK as sitk
+import tictac.backends
+import tictac.image
+
+
+class TestBackends(unittest.TestCase):
+
+    def test_backends_identical_8_3V(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        reader = sitk.ImageSeriesReader()
+        dcm_names = reader.GetGDCMSeriesFileNames(dcm_path)
+        roi = sitk.ReadImage(os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd'))
+
+        for name in dcm_names:
+            img = sitk.ReadImage(name)
+            ref_sums, ref_counts = tictac.backends.label_sums_sitk(
+                img, roi, [2, 1])
+            for backend in tictac.backends.BACKENDS.values():
+                sums, counts = backend(img, roi, [2, 1])
+                self.assertTrue(np.allclose(sums, ref_sums,
+                                            rtol=1e-12, atol=0.0))
+                self.assertFalse(np.any(counts - ref_counts))
+
+    def test_missing_label(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        reader = sitk.ImageSeriesReader()
+        img = sitk.ReadImage(reader.GetGDCMSeriesFileNames(dcm_path)[3])
+        roi = sitk.ReadImage(os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd'))
+
+        for backend in tictac.backends.BACKENDS.values():
+            sums, counts = backend(img, roi, [3])
+            self.assertEqual(float(sums[0]), 0.0)
+            self.assertEqual(float(counts[0]), 0.0)
+
+    def test_negative_labels(self):
+        img = sitk.GetImageFromArray(
+            np.arange(24, dtype=np.float32).reshape(2, 3, 4))
+        roi = sitk.GetImageFromArray(
+            np.tile(np.array([-2, -1, 0, 3], dtype=np.int16), (2, 3, 1)))
+        roi.CopyInformation(img)
+
+        ref_sums, ref_counts = tictac.backends.label_sums_sitk(
+            img, roi, [-1, 3, -2, 5])
+        self.assertFalse(np.any(ref_counts - np.array([6, 6, 6, 0])))
+        for backend in tictac.backends.BACKENDS.values():
+            sums, counts = backend(img, roi, [-1, 3, -2, 5])
+            self.assertTrue(np.allclose(sums, ref_sums))
+            self.assertFalse(np.any(counts - ref_counts))
+
+    @unittest.skipIf(importlib.util.find_spec('numba') is None,
+                     "numba not installed")
+    def test_numba_available(self):
+        self.assertTrue('numba' in tictac.backends.BACKENDS)
+
+    def test_numba_not_imported(self):
+        # Importing tictac must not import numba
+        code = "import sys, tictac; print('numba' in sys.modules)"
+        res = subprocess.run([sys.executable, '-c', code],
+                             capture_output=True, text=True, check=True)
+        self.assertEqual(res.stdout.strip(), 'False')
+
+    def test_select_backend(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        reader = sitk.ImageSeriesReader()
+        img = sitk.ReadImage(reader.GetGDCMSeriesFileNames(dcm_path)[0])
+        roi = sitk.ReadImage(os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd'))
+
+        backend = tictac.backends.select_backend([(img, roi, [1, 2])],
+                                                 repeats=1)
+        self.assertTrue(backend in tictac.backends.BACKENDS)
+
+
+class TestSeriesRoiMeansBackends(unittest.TestCase):
+
+    def test_series_roi_means_backends_8_3V(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '1', '1', 'none'],
+                    [roi_path, '2', '2', 'none']]
+        ref = tictac.image.series_roi_means(dcm_path, roi_list,
+                                            progress=False, backend='sitk')
+
+        for backend in list(tictac.backends.BACKENDS) + ['auto']:
+            dyn = tictac.image.series_roi_means(dcm_path, roi_list,
+                                                progress=False,
+                                                backend=backend)
+            self.assertFalse(np.any(dyn['tacq'] - ref['tacq']))
+            self.assertTrue(np.allclose(dyn['1'], ref['1'],
+                                        rtol=1e-12, atol=0.0))
+            self.assertTrue(np.allclose(dyn['2'], ref['2'],
+                                        rtol=1e-12, atol=0.0))
+
+    def test_series_roi_means_unknown_backend(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '1', '1', 'none']]
+        with self.assertRaises(ValueError):
+            tictac.image.series_roi_means(dcm_path, roi_list,
+                                          backend='abacus')
+
+    def test_series_roi_means_missing_label(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '7', '7', 'none']]
+        with self.assertRaises(ValueError):
+            tictac.image.series_roi_means(dcm_path, roi_list)
@@ -23,6 +23,36 @@ class TestGetAcqDateTime(unittest.TestCase):
         self.assertEqual(dt, datetime(2023, 12, 1, 13, 30, 40, 800000))
 
 
+class TestGetFrameDuration(unittest.TestCase):
+
+    def test_frame_duration_8_3V_1(self):
+        dcm_path = os.path.join(
+            'test', 'data', '8_3V',
+            'Patient_test_Study_10_Scan_10_Bed_1_Dyn_1.dcm')
+        dur = tictac.core.get_frame_duration(dcm_path)
+        assert dur is not None
+        self.assertAlmostEqual(dur, 3.04)
+
+    def test_frame_duration_8_3V_2(self):
+        dcm_path = os.path.join(
+            'test', 'data', '8_3V',
+            'Patient_test_Study_10_Scan_10_Bed_1_Dyn_2.dcm')
+        dur = tictac.core.get_frame_duration(dcm_path)
+        assert dur is not None
+        self.assertAlmostEqual(dur, 3.26)
+
+
+class TestGetFrameTiming(unittest.TestCase):
+
+    def test_frame_timing_8_3V_5(self):
+        dcm_path = os.path.join(
+            'test', 'data', '8_3V',
+            'Patient_test_Study_10_Scan_10_Bed_1_Dyn_5.dcm')
+        dt, dur = tictac.core.get_frame_timing(dcm_path)
+        self.assertEqual(dt, tictac.core.get_acq_datetime(dcm_path))
+        self.assertEqual(dur, tictac.core.get_frame_duration(dcm_path))
+
+
 class TestSaveDict(unittest.TestCase):
 
     def test_save_table(self):
@@ -54,3 +84,151 @@ class TestSaveDict(unittest.TestCase):
     def tearDown(self):
         if os.path.exists(os.path.join('test', 'tac.txt')):
             os.remove(os.path.join('test', 'tac.txt'))
+
+
+class TestUnitFactor(unittest.TestCase):
+
+    def test_unit_factor(self):
+        self.assertAlmostEqual(
+            tictac.core.unit_factor('Bq/mL', 'kBq/mL'), 1e-3)
+        self.assertAlmostEqual(
+            tictac.core.unit_factor('kBq/mL', 'Bq/mL'), 1e3)
+        self.assertAlmostEqual(
+            tictac.core.unit_factor('uCi/mL', 'kBq/mL'), 37.0)
+
+    def test_unit_factor_unknown(self):
+        with self.assertRaises(ValueError):
+            tictac.core.unit_factor('Bq/mL', 'Bq/furlong')
+
+
+class TestCorrectTable(unittest.TestCase):
+
+    def test_correct_table_factor(self):
+        tac: dict[str, npt.NDArray[np.float64]] = \
+            {'tacq': np.array([0.0, 1.2, 5.4]),
+             'a': np.array([1.0, 2.0, 3.0])}
+        res = tictac.core.correct_table(tac, factor=2.0)
+
+        self.assertFalse(np.any(res['tacq'] - tac['tacq']))
+        self.assertFalse(np.any(res['a'] - np.array([2.0, 4.0, 6.0])))
+
+    def test_correct_table_decay(self):
+        tac: dict[str, npt.NDArray[np.float64]] = \
+            {'tacq': np.array([0.0, 10.0, 20.0]),
+             'a': np.array([1.0, 1.0, 1.0]),
+             'b': np.array([2.0, 2.0, 2.0])}
+        tdur = np.array([0.0, 0.0, 10.0])
+        res = tictac.core.correct_table(tac, half_life=10.0, factor=0.5,
+                                        tdur=tdur)
+
+        # The last frame also decays by half during the frame
+        during = np.log(2.0) / 0.5
+        self.assertFalse(np.any(res['tacq'] - tac['tacq']))
+        self.assertTrue(np.allclose(res['a'],
+                                    np.array([0.5, 1.0, 2.0 * during])))
+        self.assertTrue(np.allclose(res['b'],
+                                    np.array([1.0, 2.0, 4.0 * during])))
+
+    def test_correct_table_decay_no_durations(self):
+        tac: dict[str, npt.NDArray[np.float64]] = \
+            {'tacq': np.array([0.0, 10.0]),
+             'a': np.array([1.0, 1.0])}
+        with self.assertRaises(ValueError):
+            tictac.core.correct_table(tac, half_life=10.0)
+
+    def test_decay_factors_integrated(self):
+        # The factor of a frame is the inverse of the mean decay over the
+        # frame
+        tacq = np.array([0.0, 30.0])
+        tdur = np.array([30.0, 60.0])
+        res = tictac.core.decay_factors(tacq, tdur, 20.0)
+
+        lam = np.log(2.0) / 20.0
+        mean_decay = ((np.exp(-lam * tacq) - np.exp(-lam * (tacq + tdur))) /
+                      (lam * tdur))
+        self.assertTrue(np.allclose(res, 1.0 / mean_decay))
+
+
+class TestSaveTableDb(unittest.TestCase):
+
+    def test_save_load_table_db(self):
+        tac: dict[str, npt.NDArray[np.float64]] = \
+            {'tacq': np.array([0.0, 1.2, 5.4]),
+             '1': np.array([1.0, 2.0, 3.0]),
+             '2': np.array([0.5, 0.1, 3.0])
+             }
+        db_path = os.path.join('test', 'tac.db')
+        tictac.core.save_table_db(tac, db_path, 'study1')
+        res = tictac.core.load_table_db(db_path, 'study1')
+
+        self.assertEqual(set(res), {'tacq', '1', '2'})
+        self.assertFalse(np.any(res['tacq'] - tac['tacq']))
+        self.assertFalse(np.any(res['1'] - tac['1']))
+        self.assertFalse(np.any(res['2'] - tac['2']))
+
+    def test_save_table_db_replace(self):
+        db_path = os.path.join('test', 'tac.db')
+        tictac.core.save_table_db(
+            {'tacq': np.array([0.0, 1.0, 2.0]),
+             'a': np.array([1.0, 2.0, 3.0])}, db_path, 'study1')
+        tictac.core.save_table_db(
+            {'tacq': np.array([0.0, 1.0]),
+             'a': np.array([4.0, 5.0])}, db_path, 'study1')
+        res = tictac.core.load_table_db(db_path, 'study1')
+
+        self.assertFalse(np.any(res['tacq'] - np.array([0.0, 1.0])))
+        self.assertFalse(np.any(res['a'] - np.array([4.0, 5.0])))
+
+    def test_load_roi_db(self):
+        tables: dict[str, dict[str, npt.NDArray[np.float64]]] = {
+            's1': {'tacq': np.array([0.0, 1.0]),
+                   'a': np.array([1.0, 2.0]),
+                   'b': np.array([3.0, 4.0])},
+            's2': {'tacq': np.array([0.0, 2.0, 4.0]),
+                   'a': np.array([5.0, 6.0, 7.0])}}
+        db_path = os.path.join('test', 'tac.db')
+        tictac.core.save_tables_db(tables, db_path)
+        tictac.core.save_table_db(
+            {'tacq': np.array([0.0]), 'a': np.array([8.0])},
+            db_path, 's2', series='late')
+
+        res = tictac.core.load_roi_db(db_path, 'a', series='')
+        self.assertEqual(set(res), {'s1', 's2'})
+        self.assertFalse(np.any(res['s1']['a'] - np.array([1.0, 2.0])))
+        self.assertFalse(np.any(res['s2']['tacq'] -
+                                np.array([0.0, 2.0, 4.0])))
+        self.assertFalse(np.any(res['s2']['a'] - np.array([5.0, 6.0, 7.0])))
+
+        res = tictac.core.load_roi_db(db_path, 'a')
+        self.assertEqual(set(res), {'s1', 's2/', 's2/late'})
+        self.assertFalse(np.any(res['s2/late']['a'] - np.array([8.0])))
+
+    def test_load_db_missing(self):
+        db_path = os.path.join('test', 'tac.db')
+        with self.assertRaises(FileNotFoundError):
+            tictac.core.load_table_db(db_path, 'study1')
+        with self.assertRaises(FileNotFoundError):
+            tictac.core.load_roi_db(db_path, 'a')
+        self.assertFalse(os.path.exists(db_path))
+
+    def test_load_table_db_different_frames(self):
+        db_path = os.path.join('test', 'tac.db')
+        tictac.core.save_table_db(
+            {'tacq': np.array([0.0, 1.0, 2.0]),
+             'a': np.array([1.0, 2.0, 3.0])}, db_path, 'study1')
+        tictac.core.save_table_db(
+            {'tacq': np.array([0.0, 1.0]),
+             'b': np.array([4.0, 5.0])}, db_path, 'study1')
+        with self.assertRaises(ValueError):
+            tictac.core.load_table_db(db_path, 'study1')
+
+    def test_save_table_db_short_column(self):
+        db_path = os.path.join('test', 'tac.db')
+        with self.assertRaises(ValueError):
+            tictac.core.save_table_db(
+                {'tacq': np.array([0.0, 1.0, 2.0]),
+                 'a': np.array([1.0, 2.0])}, db_path, 'study1')
+
+    def tearDown(self):
+        if os.path.exists(os.path.join('test', 'tac.db')):
+            os.remove(os.path.join('test', 'tac.db'))
@@ -0,0 +1,240 @@
+import os
+import signal
+import socket
+import threading
+import time
+import unittest
+import multiprocessing
+import numpy as np
+import numpy.typing as npt
+import tictac.backends
+import tictac.distributed
+import tictac.image
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return int(sock.getsockname()[1])
+
+
+def _dying_worker(address: tuple[str, int], authkey: bytes):
+    # Take a lease on one task and exit without returning a result
+    manager = tictac.distributed._QueueManager(address=address,
+                                               authkey=authkey)
+    for _ in range(100):
+        try:
+            manager.connect()
+            break
+        except OSError:
+            time.sleep(0.1)
+    task = manager.get_task_queue().get()  # type: ignore[attr-defined]
+    manager.get_result_queue().put(  # type: ignore[attr-defined]
+        ('started', task['id'], task['attempt'], 'dying'))
+
+
+def _late_worker(address: tuple[str, int], authkey: bytes):
+    time.sleep(2.0)
+    tictac.distributed.run_worker(address, authkey)
+
+
+class TestParseAddress(unittest.TestCase):
+
+    def test_parse_address(self):
+        address = tictac.distributed.parse_address('node1:5000')
+        self.assertEqual(address, ('node1', 5000))
+
+    def test_parse_address_no_port(self):
+        with self.assertRaises(ValueError):
+            tictac.distributed.parse_address('node1')
+
+
+class TestSplitTasks(unittest.TestCase):
+
+    def test_split_tasks_studies(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_list = [['roi.nrrd', '1', 'a', 'none']]
+        tasks = tictac.distributed.split_tasks(
+            {'s1': dcm_path, 's2': dcm_path}, roi_list)
+
+        self.assertEqual(len(tasks), 2)
+        self.assertEqual([task['id'] for task in tasks], [0, 1])
+        self.assertEqual([task['study'] for task in tasks], ['s1', 's2'])
+        self.assertEqual([task['frames'] for task in tasks], [None, None])
+
+    def test_split_tasks_frames(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_list = [['roi.nrrd', '1', 'a', 'none']]
+        tasks = tictac.distributed.split_tasks(
+            {'s1': dcm_path}, roi_list, frames_per_task=4)
+
+        self.assertEqual([task['frames'] for task in tasks],
+                         [(0, 3), (4, 7), (8, 8)])
+        self.assertEqual([task['part'] for task in tasks], [0, 1, 2])
+
+    def test_split_tasks_time_window_rebin(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_list = [['roi.nrrd', '1', 'a', 'none']]
+        tasks = tictac.distributed.split_tasks(
+            {'s1': dcm_path}, roi_list, frames_per_task=3,
+            time_window=(3.0, 20.0), rebin=2)
+
+        self.assertEqual([task['frames'] for task in tasks],
+                         [(1, 4), (5, 6)])
+
+        # The tasks carry the file names and frame times of their frames
+        self.assertEqual(len(tasks[0]['dcm_names']), 4)
+        self.assertEqual(len(tasks[1]['dcm_names']), 2)
+        self.assertFalse(np.any(tasks[1]['frame_times']['tacq'] -
+                                np.array([16.0, 19.3])))
+        self.assertEqual(len(tasks[1]['frame_times']['tdur']), 2)
+
+    def test_split_tasks_auto_backend(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '1', 'a', 'none']]
+        tasks = tictac.distributed.split_tasks(
+            {'s1': dcm_path}, roi_list, frames_per_task=4, backend='auto')
+
+        # Every task gets the same concrete backend
+        backends = {task['backend'] for task in tasks}
+        self.assertEqual(len(backends), 1)
+        self.assertIn(backends.pop(), tictac.backends.BACKENDS)
+
+    def test_split_tasks_invalid(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_list = [['roi.nrrd', '1', 'a', 'none']]
+        for frames_per_task, rebin in [(0, 1), (-3, 1), (None, 0), (4, 0)]:
+            with self.assertRaises(ValueError):
+                tictac.distributed.split_tasks(
+                    {'s1': dcm_path}, roi_list,
+                    frames_per_task=frames_per_task, rebin=rebin)
+
+
+class TestMergeResults(unittest.TestCase):
+
+    def test_merge_results(self):
+        parts: list[dict[str, npt.NDArray[np.float64]]] = [
+            {'tacq': np.array([0.0, 1.0]), 'a': np.array([5.0, 6.0])},
+            {'tacq': np.array([2.0]), 'a': np.array([7.0])}]
+        res = tictac.distributed.merge_results(parts)
+
+        self.assertFalse(np.any(res['tacq'] - np.array([0.0, 1.0, 2.0])))
+        self.assertFalse(np.any(res['a'] - np.array([5.0, 6.0, 7.0])))
+
+
+class TestRunCoordinator(unittest.TestCase):
+
+    def test_run_coordinator_local_workers(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '1', '1', 'none'],
+                    [roi_path, '2', '2', 'none']]
+        tasks = tictac.distributed.split_tasks(
+            {'s1': dcm_path, 's2': dcm_path}, roi_list, frames_per_task=2)
+        res = tictac.distributed.run_coordinator(
+            tasks, ('localhost', 0), b'test', n_local_workers=2,
+            progress=False)
+        ref = tictac.image.series_roi_means(dcm_path, roi_list,
+                                            progress=False)
+
+        self.assertEqual(set(res), {'s1', 's2'})
+        for study in res:
+            self.assertFalse(np.any(res[study]['tacq'] - ref['tacq']))
+            self.assertTrue(np.allclose(res[study]['1'], ref['1']))
+            self.assertTrue(np.allclose(res[study]['2'], ref['2']))
+
+    def test_run_coordinator_failed_task(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'does_not_exist.nrrd')
+        roi_list = [[roi_path, '1', '1', 'none']]
+        tasks = tictac.distributed.split_tasks({'s1': dcm_path}, roi_list)
+
+        with self.assertRaises(RuntimeError) as cm:
+            tictac.distributed.run_coordinator(
+                tasks, ('localhost', 0), b'test', n_local_workers=1,
+                max_retries=1, progress=False)
+        self.assertIn('failed after 2 attempts', str(cm.exception))
+
+    def test_run_coordinator_queued_tasks_not_timed_out(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '1', '1', 'none']]
+        tasks = tictac.distributed.split_tasks(
+            {'s1': dcm_path, 's2': dcm_path, 's3': dcm_path}, roi_list,
+            frames_per_task=1)
+
+        # The tasks wait in the queue much longer than the timeout, but the
+        # timeout only starts when a worker picks up a task
+        res = tictac.distributed.run_coordinator(
+            tasks, ('localhost', 0), b'test', n_local_workers=1,
+            max_retries=0, task_timeout=1.0, progress=False)
+        self.assertEqual(len(res['s3']['1']), 9)
+
+    def test_run_coordinator_dead_worker(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '2', '2', 'none']]
+        tasks = tictac.distributed.split_tasks({'s1': dcm_path}, roi_list)
+        ref = tictac.image.series_roi_means(dcm_path, roi_list,
+                                            progress=False)
+
+        address = ('localhost', _free_port())
+        workers = [multiprocessing.Process(target=_dying_worker,
+                                           args=(address, b'test')),
+                   multiprocessing.Process(target=_late_worker,
+                                           args=(address, b'test'))]
+        for worker in workers:
+            worker.start()
+        try:
+            res = tictac.distributed.run_coordinator(
+                tasks, address, b'test', max_retries=1, task_timeout=1.0,
+                progress=False)
+        finally:
+            for worker in workers:
+                worker.join()
+
+        self.assertTrue(np.allclose(res['s1']['2'], ref['2']))
+
+    def test_run_coordinator_killed_local_worker(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '2', '2', 'none']]
+        tasks = tictac.distributed.split_tasks(
+            {'s1': dcm_path, 's2': dcm_path}, roi_list, frames_per_task=1)
+        ref = tictac.image.series_roi_means(dcm_path, roi_list,
+                                            progress=False)
+
+        # Kill the local worker (not the manager server) once it has started
+        killed: list[int] = []
+
+        def kill_worker():
+            deadline = time.monotonic() + 30.0
+            while not killed and time.monotonic() < deadline:
+                for child in multiprocessing.active_children():
+                    if (child.pid is not None and
+                            not child.name.startswith('_QueueManager')):
+                        time.sleep(0.5)
+                        os.kill(child.pid, signal.SIGKILL)
+                        killed.append(child.pid)
+                        break
+                time.sleep(0.05)
+
+        killer = threading.Thread(target=kill_worker)
+        killer.start()
+        try:
+            res = tictac.distributed.run_coordinator(
+                tasks, ('localhost', 0), b'test', n_local_workers=1,
+                progress=False)
+        finally:
+            killer.join()
+
+        self.assertEqual(len(killed), 1)
+        for study in res:
+            self.assertTrue(np.allclose(res[study]['2'], ref['2']))
@@ -1,5 +1,8 @@
 import os.path
 import unittest
+from unittest import mock
+import tictac.backends
+import tictac.core
 import tictac.image
 import numpy as np
 import SimpleITK as sitk
@@ -101,6 +104,114 @@ class TestResampleSeriesToReference(unittest.TestCase):
         self.assertEqual(img[8].GetDimension(), 3)
 
 
+class TestSeriesFrameTimes(unittest.TestCase):
+
+    def test_series_frame_times_8_3V(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        reader = sitk.ImageSeriesReader()
+        dcm_names = reader.GetGDCMSeriesFileNames(dcm_path)
+        timing = tictac.image.series_frame_times(dcm_names)
+
+        tacq_exp = np.array([0, 3.0, 6.3, 9.5, 12.8, 16.0, 19.3, 22.5, 25.8])
+        self.assertFalse(np.any(timing['tacq'] - tacq_exp))
+        self.assertEqual(len(timing['tdur']), 9)
+        self.assertAlmostEqual(float(timing['tdur'][0]), 3.04)
+        self.assertAlmostEqual(float(timing['tdur'][1]), 3.26)
+
+    def test_series_frame_times_reads_headers_once(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        reader = sitk.ImageSeriesReader()
+        dcm_names = reader.GetGDCMSeriesFileNames(dcm_path)
+        with mock.patch('tictac.core._read_header',
+                        wraps=tictac.core._read_header) as read_header:
+            tictac.image.series_frame_times(dcm_names)
+
+        self.assertEqual(read_header.call_count, len(dcm_names))
+
+
+class TestSelectFrames(unittest.TestCase):
+
+    def test_select_all(self):
+        tacq = np.array([0.0, 10.0, 20.0, 30.0])
+        idx = tictac.image.select_frames(tacq)
+        self.assertEqual(list(idx), [0, 1, 2, 3])
+
+    def test_select_frames(self):
+        tacq = np.array([0.0, 10.0, 20.0, 30.0])
+        idx = tictac.image.select_frames(tacq, frames=(1, 2))
+        self.assertEqual(list(idx), [1, 2])
+
+    def test_select_time_window(self):
+        tacq = np.array([0.0, 10.0, 20.0, 30.0])
+        idx = tictac.image.select_frames(tacq, time_window=(5.0, 20.0))
+        self.assertEqual(list(idx), [1, 2])
+
+    def test_select_frames_and_time_window(self):
+        tacq = np.array([0.0, 10.0, 20.0, 30.0])
+        idx = tictac.image.select_frames(tacq, frames=(0, 1),
+                                         time_window=(5.0, 30.0))
+        self.assertEqual(list(idx), [1])
+
+
+class TestRebinFrames(unittest.TestCase):
+
+    def test_rebin_frames(self):
+        tacq = np.array([0.0, 1.0, 3.0, 6.0, 10.0])
+        tdur = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+        sums = {'a': np.array([10.0, 20.0, 30.0, 40.0, 50.0])}
+        counts = {'a': np.array([10.0, 10.0, 10.0, 10.0, 10.0])}
+        res = tictac.image.rebin_frames(tacq, tdur, sums, counts, 2)
+
+        self.assertFalse(np.any(res['tacq'] - np.array([0.0, 3.0, 10.0])))
+        a_exp = np.array([(1.0 + 4.0) / 3.0, (9.0 + 16.0) / 7.0, 5.0])
+        self.assertTrue(np.allclose(res['a'], a_exp))
+
+    def test_rebin_frames_no_merge(self):
+        tacq = np.array([0.0, 1.0, 3.0])
+        tdur = np.array([1.0, 2.0, 3.0])
+        sums = {'a': np.array([10.0, 20.0, 30.0])}
+        counts = {'a': np.array([10.0, 10.0, 10.0])}
+        res = tictac.image.rebin_frames(tacq, tdur, sums, counts, 1)
+
+        self.assertFalse(np.any(res['tacq'] - tacq))
+        self.assertTrue(np.allclose(res['a'], np.array([1.0, 2.0, 3.0])))
+
+
+class TestParseDerivedRoi(unittest.TestCase):
+
+    def test_parse_derived_roi(self):
+        terms = tictac.image.parse_derived_roi('a + b - c')
+        self.assertEqual(terms, [(1.0, 'a'), (1.0, 'b'), (-1.0, 'c')])
+
+    def test_parse_derived_roi_leading_sign(self):
+        terms = tictac.image.parse_derived_roi('- a + b')
+        self.assertEqual(terms, [(-1.0, 'a'), (1.0, 'b')])
+
+    def test_parse_derived_roi_invalid(self):
+        with self.assertRaises(ValueError):
+            tictac.image.parse_derived_roi('a b')
+        with self.assertRaises(ValueError):
+            tictac.image.parse_derived_roi('a + + b')
+        with self.assertRaises(ValueError):
+            tictac.image.parse_derived_roi('')
+
+
+class TestDeriveRois(unittest.TestCase):
+
+    def test_derive_rois(self):
+        sums = {'a': np.array([10.0, 20.0]), 'b': np.array([2.0, 4.0])}
+        counts = {'a': np.array([5.0, 5.0]), 'b': np.array([1.0, 1.0])}
+        derived = {'ab': [(1.0, 'a'), (1.0, 'b')],
+                   'a-b': [(1.0, 'a'), (-1.0, 'b')]}
+        dsums, dcounts = tictac.image.derive_rois(sums, counts, derived)
+
+        self.assertFalse(np.any(dsums['ab'] - np.array([12.0, 24.0])))
+        self.assertFalse(np.any(dcounts['ab'] - np.array([6.0, 6.0])))
+        self.assertFalse(np.any(dsums['a-b'] - np.array([8.0, 16.0])))
+        self.assertFalse(np.any(dcounts['a-b'] - np.array([4.0, 4.0])))
+        self.assertFalse('ab' in sums)
+
+
 class TestSeriesRoiMeans(unittest.TestCase):
 
     def test_series_roi_means_8_3V_no_resample(self):
@@ -185,3 +296,123 @@ class TestSeriesRoiMeans(unittest.TestCase):
 
         r2 = dyn['b']
         self.assertAlmostEqual(float(r2[3]), 13473.5, places=1)
+
+    def test_series_roi_means_frames(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '1', '1', 'none']]
+        dyn = tictac.image.series_roi_means(dcm_path, roi_list,
+                                            frames=(2, 4))
+
+        tacq_exp = np.array([6.3, 9.5, 12.8])
+        self.assertFalse(np.any(dyn['tacq'] - tacq_exp))
+
+        r1_exp = np.array([1229.61, 12019.3, 12058.9])
+        self.assertTrue(np.all(abs(dyn['1'] - r1_exp) < 0.1))
+
+    def test_series_roi_means_time_window(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '2', '2', 'none']]
+        dyn = tictac.image.series_roi_means(dcm_path, roi_list,
+                                            time_window=(0.0, 7.0))
+
+        tacq_exp = np.array([0, 3.0, 6.3])
+        self.assertFalse(np.any(dyn['tacq'] - tacq_exp))
+
+        r2_exp = np.array([31.3157, 3501.54, 33128.1])
+        self.assertTrue(np.all(abs(dyn['2'] - r2_exp) < 0.1))
+
+    def test_series_roi_means_empty_selection(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '2', '2', 'none']]
+        with self.assertRaises(ValueError):
+            tictac.image.series_roi_means(dcm_path, roi_list,
+                                          time_window=(100.0, 200.0))
+
+    def test_series_roi_means_rebin(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '2', '2', 'none']]
+        dyn = tictac.image.series_roi_means(dcm_path, roi_list, rebin=4)
+        ref = tictac.image.series_roi_means(dcm_path, roi_list)
+
+        reader = sitk.ImageSeriesReader()
+        timing = tictac.image.series_frame_times(
+            reader.GetGDCMSeriesFileNames(dcm_path))
+        tdur = timing['tdur']
+
+        tacq_exp = np.array([0, 12.8, 25.8])
+        self.assertFalse(np.any(dyn['tacq'] - tacq_exp))
+
+        r2_exp = np.array([
+            np.sum(ref['2'][0:4] * tdur[0:4]) / np.sum(tdur[0:4]),
+            np.sum(ref['2'][4:8] * tdur[4:8]) / np.sum(tdur[4:8]),
+            ref['2'][8]])
+        self.assertTrue(np.allclose(dyn['2'], r2_exp))
+
+    def test_series_roi_means_decay_rebin(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '2', '2', 'none']]
+        dyn = tictac.image.series_roi_means(dcm_path, roi_list, rebin=4,
+                                            half_life=6.3)
+        ref = tictac.image.series_roi_means(dcm_path, roi_list)
+
+        reader = sitk.ImageSeriesReader()
+        timing = tictac.image.series_frame_times(
+            reader.GetGDCMSeriesFileNames(dcm_path))
+        tdur = timing['tdur']
+        decay = tictac.core.decay_factors(timing['tacq'], tdur, 6.3)
+
+        # Each frame is decay corrected before the frames are merged
+        corrected = ref['2'] * decay
+        r2_exp = np.array([
+            np.sum(corrected[0:4] * tdur[0:4]) / np.sum(tdur[0:4]),
+            np.sum(corrected[4:8] * tdur[4:8]) / np.sum(tdur[4:8]),
+            corrected[8]])
+        self.assertTrue(np.allclose(dyn['2'], r2_exp))
+
+    def test_select_series_backend(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '1', '1', 'none'],
+                    [roi_path, '2', '2', 'none']]
+        reader = sitk.ImageSeriesReader()
+        dcm_name = reader.GetGDCMSeriesFileNames(dcm_path)[0]
+        backend = tictac.image.select_series_backend(dcm_name, roi_list)
+        self.assertIn(backend, tictac.backends.BACKENDS)
+
+    def test_series_roi_means_derived(self):
+        dcm_path = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join(
+            'test', 'data', '8_3V_seg', 'Segmentation.nrrd')
+        roi_list = [[roi_path, '1', '1', 'none'],
+                    [roi_path, '2', '2', 'none']]
+        derived = [['12', '1 + 2'], ['1b', '12 - 2']]
+        with self.assertRaises(ValueError):
+            tictac.image.series_roi_means(dcm_path, roi_list,
+                                          derived=derived)
+
+        derived = [['12', '1 + 2'], ['1b', '1 + 2 - 2']]
+        dyn = tictac.image.series_roi_means(dcm_path, roi_list,
+                                            derived=derived)
+
+        self.assertEqual(list(dyn), ['tacq', '1', '2', '12', '1b'])
+
+        # Compute the union mean directly from the images
+        roi = sitk.GetArrayFromImage(sitk.ReadImage(roi_path))
+        reader = sitk.ImageSeriesReader()
+        r12_exp = []
+        for name in reader.GetGDCMSeriesFileNames(dcm_path):
+            img = sitk.GetArrayFromImage(sitk.ReadImage(name))
+            r12_exp.append(np.mean(img[(roi == 1) | (roi == 2)]))
+        self.assertTrue(np.allclose(dyn['12'], np.array(r12_exp)))
+        self.assertTrue(np.allclose(dyn['1b'], dyn['1']))
@@ -1,7 +1,12 @@
+import SimpleITK as sitk
 import os
 import unittest
 import numpy as np
 import numpy.typing as npt
+import tictac
+import tictac.core
+import tictac.image
+import tictac.threads
 from tictac import __main__
 
 
@@ -208,6 +213,45 @@ class TestMainFunction(unittest.TestCase):
                                0.0727437])
         self.assertTrue(np.all((r2 - r2_exp) < 0.1))
 
+    def test_main_derive_decay_units(self):
+
+        img_dir = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join('test', 'data', '8_3V_seg',
+                                'Segmentation.nrrd')
+        out_path = os.path.join('test', 'tac.txt')
+
+        __main__.main(['-i', img_dir, '-o', out_path,
+                       '--roi', roi_path, '1', '1', 'none',
+                       '--roi', roi_path, '2', '2', 'none',
+                       '--derive', '12', '1 + 2',
+                       '--decay', '6.3',
+                       '--units', 'Bq/mL', 'kBq/mL'
+                       ])
+
+        # reassemble outfile into dict:
+        with open(out_path) as f:
+            header = f.readline()
+        header_cols = header.split()
+        header_cols = header_cols[1:]
+
+        # Load data (excluding header)
+        data = np.loadtxt(out_path)
+
+        # Put data into a dict object with correct labels
+        data_dict: dict[str, npt.NDArray[np.float64]] = {}
+        for i in range(len(header_cols)):
+            data_dict[header_cols[i]] = data[:, i]
+
+        self.assertTrue('12' in data_dict)
+
+        dcm_names = sitk.ImageSeriesReader.GetGDCMSeriesFileNames(img_dir)
+        timing = tictac.image.series_frame_times(dcm_names)
+        decay = tictac.core.decay_factors(timing['tacq'], timing['tdur'], 6.3)
+
+        r2 = data_dict['2']
+        self.assertAlmostEqual(float(r2[0]), 0.0313157 * decay[0], places=4)
+        self.assertAlmostEqual(float(r2[2]), 33.1281 * decay[2], places=2)
+
     def test_main_different_paths(self):
 
         img_dir = os.path.join('test', 'data', '8_3V')
@@ -244,6 +288,136 @@ class TestMainFunction(unittest.TestCase):
         r2 = data_dict['b']
         self.assertAlmostEqual(float(r2[3]), 13473.5, places=1)
 
+    def test_main_time_window_rebin(self):
+
+        img_dir = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join('test', 'data', '8_3V_seg',
+                                'Segmentation.nrrd')
+        out_path = os.path.join('test', 'tac.txt')
+
+        __main__.main(['-i', img_dir, '-o', out_path,
+                       '--roi', roi_path, '1', 'a', 'none',
+                       '--time-window', '3.0', '10.0',
+                       '--rebin', '2'
+                       ])
+
+        # reassemble outfile into dict:
+        with open(out_path) as f:
+            header = f.readline()
+        header_cols = header.split()
+        header_cols = header_cols[1:]
+
+        # Load data (excluding header)
+        data = np.loadtxt(out_path)
+
+        # Put data into a dict object with correct labels
+        data_dict: dict[str, npt.NDArray[np.float64]] = {}
+        for i in range(len(header_cols)):
+            data_dict[header_cols[i]] = data[:, i]
+
+        tacq = data_dict['tacq']
+        self.assertFalse(np.any(tacq - np.array([3.0, 9.5])))
+
+        r1 = data_dict['a']
+        self.assertEqual(len(r1), 2)
+        self.assertAlmostEqual(float(r1[1]), 12019.3, places=1)
+
+    def test_main_workers(self):
+
+        img_dir = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join('test', 'data', '8_3V_seg',
+                                'Segmentation.nrrd')
+        out_path = os.path.join('test', 'tac.txt')
+
+        __main__.main(['-i', img_dir, '-o', out_path,
+                       '--roi', roi_path, '2', 'b', 'none',
+                       '--workers', '2', '--chunk', '4',
+                       '--threads', '2'
+                       ])
+
+        # reassemble outfile into dict:
+        with open(out_path) as f:
+            header = f.readline()
+        header_cols = header.split()
+        header_cols = header_cols[1:]
+
+        # Load data (excluding header)
+        data = np.loadtxt(out_path)
+
+        # Put data into a dict object with correct labels
+        data_dict: dict[str, npt.NDArray[np.float64]] = {}
+        for i in range(len(header_cols)):
+            data_dict[header_cols[i]] = data[:, i]
+
+        tacq = data_dict['tacq']
+        tacq_exp = np.array([0, 3.0, 6.3, 9.5, 12.8, 16.0, 19.3, 22.5, 25.8])
+        self.assertFalse(np.any(tacq - tacq_exp))
+
+        r2 = data_dict['b']
+        r2_exp = np.array([31.3157, 3501.54, 33128.1, 38544.1,
+                           9529.26, 642.525, 2.57748, 0.345963, 0.0727437])
+        self.assertTrue(np.all(abs(r2 - r2_exp) < 0.1))
+
+    def test_main_workers_invalid_chunk(self):
+
+        img_dir = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join('test', 'data', '8_3V_seg',
+                                'Segmentation.nrrd')
+        out_path = os.path.join('test', 'tac.txt')
+
+        for chunk in ['0', '-3']:
+            with self.assertRaises(ValueError):
+                __main__.main(['-i', img_dir, '-o', out_path,
+                               '--roi', roi_path, '2', 'b', 'none',
+                               '--workers', '2', '--chunk', chunk
+                               ])
+
+    def test_main_workers_invalid_rebin(self):
+
+        img_dir = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join('test', 'data', '8_3V_seg',
+                                'Segmentation.nrrd')
+        out_path = os.path.join('test', 'tac.txt')
+
+        with self.assertRaises(ValueError):
+            __main__.main(['-i', img_dir, '-o', out_path,
+                           '--roi', roi_path, '2', 'b', 'none',
+                           '--workers', '2', '--rebin', '0'
+                           ])
+
+    def test_main_sqlite(self):
+
+        img_dir = os.path.join('test', 'data', '8_3V')
+        roi_path = os.path.join('test', 'data', '8_3V_seg',
+                                'Segmentation.nrrd')
+        out_path = os.path.join('test', 'tac.db')
+
+        __main__.main(['-i', img_dir, '-o', out_path,
+                       '--roi', roi_path, '1', 'a', 'none',
+                       '--roi', roi_path, '2', 'b', 'none',
+                       '--format', 'sqlite', '--study', 'test'
+                       ])
+
+        data_dict = tictac.load_table_db(out_path, 'test')
+
+        tacq = data_dict['tacq']
+        tacq_exp = np.array([0, 3.0, 6.3, 9.5, 12.8, 16.0, 19.3, 22.5, 25.8])
+        self.assertFalse(np.any(tacq - tacq_exp))
+
+        r2 = data_dict['b']
+        r2_exp = np.array([31.3157, 3501.54, 33128.1, 38544.1,
+                           9529.26, 642.525, 2.57748, 0.345963, 0.0727437])
+        self.assertTrue(np.all(abs(r2 - r2_exp) < 0.1))
+
+    def setUp(self):
+        self.threads = tictac.threads.get_threads()
+        self.environ = dict(os.environ)
+
     def tearDown(self):
+        tictac.threads.set_threads(self.threads)
+        os.environ.clear()
+        os.environ.update(self.environ)
         if os.path.exists(os.path.join('test', 'tac.txt')):
             os.remove(os.path.join('test', 'tac.txt'))
+        if os.path.exists(os.path.join('test', 'tac.db')):
+            os.remove(os.path.join('test', 'tac.db'))
@@ -0,0 +1,63 @@
+import os
+import time
+import unittest
+from unittest import mock
+import tictac.threads
+
+
+class TestSetThreads(unittest.TestCase):
+
+    def setUp(self):
+        self.threads = tictac.threads.get_threads()
+        self.environ = dict(os.environ)
+
+    def test_set_threads(self):
+        tictac.threads.set_threads(2)
+        self.assertEqual(tictac.threads.get_threads(), 2)
+        self.assertEqual(os.environ['OMP_NUM_THREADS'], '2')
+        self.assertEqual(os.environ['OPENBLAS_NUM_THREADS'], '2')
+
+    def test_set_threads_no_threadpoolctl(self):
+        with mock.patch('tictac.threads.threadpoolctl', None):
+            with self.assertWarns(RuntimeWarning):
+                tictac.threads.set_threads(2)
+
+    def test_set_threads_invalid(self):
+        with self.assertRaises(ValueError):
+            tictac.threads.set_threads(0)
+
+    def tearDown(self):
+        tictac.threads.set_threads(self.threads)
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+
+class TestSplitThreads(unittest.TestCase):
+
+    def test_max_workers(self):
+        self.assertEqual(tictac.threads.max_workers(2, 4), 2)
+        self.assertEqual(tictac.threads.max_workers(8, 4), 4)
+        self.assertEqual(tictac.threads.max_workers(None, 4), 4)
+
+    def test_split_threads(self):
+        self.assertEqual(tictac.threads.split_threads(8, 4), 2)
+        self.assertEqual(tictac.threads.split_threads(8, 3), 2)
+        self.assertEqual(tictac.threads.split_threads(2, 4), 1)
+        self.assertEqual(tictac.threads.split_threads(4, 0), 4)
+
+
+class TestCpuUtilisation(unittest.TestCase):
+
+    def test_cpu_utilisation(self):
+        self.assertAlmostEqual(
+            tictac.threads.cpu_utilisation(6.0, 2.0, 4), 0.75)
+        self.assertEqual(tictac.threads.cpu_utilisation(1.0, 0.0, 4), 0.0)
+
+    def test_cpu_time(self):
+        # os.times only advances in clock ticks, so burn CPU until it does
+        start = tictac.threads.cpu_time()
+        deadline = time.monotonic() + 10.0
+        while (tictac.threads.cpu_time() == start and
+               time.monotonic() < deadline):
+            sum(i * i for i in range(10000))
+        self.assertGreater(tictac.threads.cpu_time(), start)